@@ -0,0 +1,31 @@
+"""
+Разбор файлов, который выполняется в дочерних процессах.
+
+Лежит вне пакета `src`: импорт `src` поднимает всё приложение,
+а этот пакет при импорте ничего не делает,
+поэтому процессы из `pool_context` его импортируют быстро и безопасно.
+"""
+import multiprocessing
+from multiprocessing.context import BaseContext
+from typing import Optional
+
+PRELOAD = ["parsers.schedule_page", "parsers.overrides_pages"]
+""" Что forkserver импортирует один раз, до того как начнёт создавать процессы """
+
+
+def pool_context() -> Optional[BaseContext]:
+    """
+    Контекст для `ProcessPoolExecutor` или None, если forkserver нет (на Windows).
+
+    fork из многопоточного сервера может оставить дочерний процесс
+    с чужой захваченной блокировкой, поэтому процессы создаёт
+    отдельный однопоточный forkserver.
+    """
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return None
+
+    context = multiprocessing.get_context("forkserver")
+    #  По умолчанию forkserver импортирует ещё и __main__, а с ним и всё приложение
+    context.set_forkserver_preload(PRELOAD)
+
+    return context
@@ -0,0 +1,15 @@
+from typing import List
+
+import pdfplumber
+
+
+def extract_pages(path: str, first: int, last: int) -> List[list]:
+    """ Строки всех таблиц со страниц PDF с `first` по `last` (не включая) """
+    rows = []
+
+    with pdfplumber.open(path) as pdf:
+        for page in pdf.pages[first:last]:
+            for table in page.extract_tables():
+                rows.extend(table)
+
+    return rows
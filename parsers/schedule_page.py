@@ -0,0 +1,161 @@
+from typing import Callable, Dict, Optional, Tuple
+
+from bs4 import BeautifulSoup
+
+from .stream_parser import TARGET_ATTRS, Weeks, read_page
+
+TEACHER = 0
+STUDENT = 1
+
+ParseResult = Optional[Tuple[str, Optional[int], Optional[dict]]]
+""" (группа или преподаватель, тип, расписание) """
+
+
+def read_soup(html: str) -> Tuple[str, Weeks]:
+    """ То же, что `stream_parser.read_page`, но через дерево BeautifulSoup """
+    return walk_soup(BeautifulSoup(html, 'html.parser'))
+
+
+def walk_soup(soup: BeautifulSoup) -> Tuple[str, Weeks]:
+    target = soup.find('font', TARGET_ATTRS).children.__next__().text.strip()
+
+    weeks = []
+
+    for table in soup.find_all("table"):
+        days = []
+
+        #  Первые две строки таблицы - это номера пар и время
+        for row in table.find_all("tr")[2:]:
+            #  Первая ячейка - это день недели
+            days.append([
+                list(cell.find("font").find("p").stripped_strings)
+                for cell in row.find_all("td")[1:]
+            ])
+
+        weeks.append(days)
+
+    return target, weeks
+
+
+ENGINES: Dict[str, Callable[[str], Tuple[str, Weeks]]] = {
+    "soup": read_soup,
+    "stream": read_page
+}
+""" Чем читать страницы расписания, выбирается в конфиге: [schedule] parser """
+
+
+def build_schedule(target: str, weeks: Weeks) -> ParseResult:
+    """ Собирает расписание из текста ячеек, см. `parse_page` """
+    if target.lower() in [".", "вакансия"]:
+        return None
+
+    if "." in target:
+        target_type = TEACHER
+    elif "-" in target:
+        target_type = STUDENT
+    else:
+        return target, None, None
+
+    schedule = dict(weeks=[])
+
+    for days in weeks:
+        week = dict(days=[])
+
+        for cells in days:
+            day = dict(lessons=[])
+
+            for childs in cells:
+                text = [text.strip() for text in childs if text.strip()]
+
+                if not text or text[0] in "-_":
+                    day["lessons"].append(None)
+                    continue
+
+                match target_type:
+                    case 0:
+                        match len(text):
+                            case 3:
+                                group, name, room = text
+                            case 2:
+                                group_and_name, room = text
+
+                                group = ""
+                                num = False
+
+                                for i in group_and_name:
+                                    if i == '-' or i.isdigit():
+                                        num = True
+                                    if num and not (i == '-' or i.isdigit()):
+                                        break
+                                    group += i
+
+                                name = group_and_name[len(group):]
+
+                        day["lessons"].append(dict(
+                            group=group,
+                            commonLesson=dict(
+                                name=name,
+                                room=room,
+                                teacher=target
+                            )
+                        ))
+                    case 1:
+                        if len(text) == 2:
+                            name = text[0]
+                            teacher, room = text[1].rsplit(" ", 1)
+
+                            lesson = dict(
+                                commonLesson=dict(
+                                    name=name,
+                                    teacher=teacher,
+                                    room=room
+                                ),
+                                group=target
+                            )
+                        elif len(text) == 3:
+                            name = text[0]
+                            subgroups = [
+                                dict(
+                                    teacher=string[6:].rsplit(" ", 1)[0],
+                                    room=string[6:].rsplit(" ", 1)[1],
+                                    subgroup_index=index+1
+                                )
+                                for index, string in enumerate(text[1:])
+                            ]
+                            """
+                            [
+                                'Иностранный язык', 
+                                '1 п/г Предеина Е.И. 201', 
+                                '2 п/г Акиева Н.В. 236'
+                            ]
+                            """
+
+                            lesson = dict(
+                                subgroupedLesson=dict(
+                                    name=name,
+                                    subgroups=subgroups
+                                ),
+                                group=target
+                            )
+                        day["lessons"].append(lesson)
+
+            week["days"].append(day)
+
+        schedule["weeks"].append(week)
+
+    return target, target_type, schedule
+
+
+def parse_page(html: str, engine: str) -> ParseResult:
+    """
+    Разбирает страницу расписания.
+
+    :param engine: Ключ `ENGINES`
+    :return: (группа или преподаватель, тип, расписание) или None, если страница не нужна
+    """
+    return build_schedule(*ENGINES[engine](html))
+
+
+def parse_member(data: bytes, engine: str) -> ParseResult:
+    """ Страница из schedule.zip как есть, в windows-1251 """
+    return parse_page(data.decode("windows-1251"), engine)
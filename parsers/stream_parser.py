@@ -0,0 +1,166 @@
+from html.parser import HTMLParser
+from typing import List, Optional, Tuple
+
+Weeks = List[List[List[List[str]]]]
+""" Недели: дни: пары: строки текста ячейки """
+
+TARGET_ATTRS = {"face": "Times New Roman", "size": "6", "color": "#ff00ff"}
+""" Атрибуты тега <font> с названием группы или именем преподавателя """
+
+VOID_TAGS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "keygen", "link", "menuitem",
+    "meta", "param", "source", "track", "wbr", "basefont", "bgsound", "command", "frame",
+    "image", "isindex", "nextid", "spacer"
+}
+""" Теги без содержимого, как их понимает BeautifulSoup """
+
+
+class _Element:
+    """ Открытый тег, за содержимым которого мы следим """
+
+    __slots__ = ("depth", "strings", "closed")
+
+    def __init__(self, depth: int):
+        #  Тег открыт, пока в стеке хотя бы `depth` тегов
+        self.depth = depth
+        self.strings: List[str] = []
+        self.closed = False
+
+
+class StreamingPage(HTMLParser):
+    """
+    Страница расписания, прочитанная за один проход без дерева тегов.
+
+    Закрывающий тег закрывает всё до ближайшего открытого тега с тем же именем,
+    лишние закрывающие теги пропускаются - так же строит дерево BeautifulSoup,
+    поэтому результат совпадает с разбором через него.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+
+        self.stack: List[str] = []
+        self._data: List[str] = []
+
+        self.target: Optional[_Element] = None
+        #  Первый ребёнок тега с названием: строка или тег
+        self.target_child: Optional[_Element] = None
+
+        #  Таблицы: строки: ячейки: строки текста из первого <p> в первом <font>, если есть
+        self.tables: List[List[List[Optional[List[str]]]]] = []
+        self._row: Optional[_Element] = None
+        self._cell: Optional[_Element] = None
+        self._font: Optional[_Element] = None
+        self._p: Optional[_Element] = None
+
+    def _is_open(self, element: Optional[_Element]) -> bool:
+        return element is not None and not element.closed and len(self.stack) >= element.depth
+
+    def _flush(self):
+        """ Подряд идущие куски текста - одна строка, как в BeautifulSoup """
+        if not self._data:
+            return
+
+        string = "".join(self._data)
+        self._data.clear()
+
+        if self._is_open(self.target_child):
+            self.target_child.strings.append(string)
+        elif self._is_open(self.target) and self.target_child is None:
+            self.target_child = _Element(len(self.stack) + 1)
+            self.target_child.strings.append(string)
+            self.target_child.closed = True
+
+        if self._is_open(self._p) and string.strip():
+            self._p.strings.append(string.strip())
+
+    def _close(self):
+        """ Запоминает, что закрылось после изменения стека """
+        for element in (self.target_child, self._p, self._font, self._cell, self._row):
+            if element is not None and len(self.stack) < element.depth:
+                element.closed = True
+
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]):
+        self._flush()
+
+        if tag in VOID_TAGS:
+            return
+
+        self.stack.append(tag)
+        depth = len(self.stack)
+
+        if self._is_open(self.target) and self.target_child is None:
+            self.target_child = _Element(depth)
+
+        if tag == "font" and self.target is None and all(
+                dict(attrs).get(name) == value for name, value in TARGET_ATTRS.items()
+        ):
+            self.target = _Element(depth)
+
+        if tag == "table":
+            self.tables.append([])
+        elif tag == "tr" and "table" in self.stack[:-1]:
+            self._row = _Element(depth)
+            self.tables[-1].append([])
+        elif tag == "td" and self._is_open(self._row):
+            self._cell = _Element(depth)
+            self._font = self._p = None
+            self.tables[-1][-1].append(None)
+        elif tag == "font" and self._is_open(self._cell) and self._font is None:
+            self._font = _Element(depth)
+        elif tag == "p" and self._is_open(self._font) and self._p is None:
+            self._p = _Element(depth)
+            #  Строки допишутся, пока <p> открыт
+            self.tables[-1][-1][-1] = self._p.strings
+
+    def handle_endtag(self, tag: str):
+        self._flush()
+
+        if tag not in self.stack:
+            return
+
+        while self.stack.pop() != tag:
+            pass
+
+        self._close()
+
+    def handle_data(self, data: str):
+        self._data.append(data)
+
+    def handle_comment(self, data: str):
+        #  Комментарий разрывает строку, но в текст ячейки не попадает
+        self._flush()
+
+    def close(self):
+        super().close()
+        self._flush()
+        self.stack.clear()
+        self._close()
+
+
+def read_page(html: str) -> Tuple[str, Weeks]:
+    """
+    :return: Название группы или имя преподавателя и ячейки с парами по неделям
+    """
+    page = StreamingPage()
+    page.feed(html)
+    page.close()
+
+    if page.target is None or page.target_child is None:
+        raise ValueError("На странице нет названия группы или преподавателя")
+
+    weeks = []
+
+    for table in page.tables:
+        days = []
+
+        #  Первые две строки таблицы - это номера пар и время, первая ячейка - день недели
+        for row in table[2:]:
+            if None in row[1:]:
+                raise ValueError("В ячейке с парой нет текста")
+
+            days.append(row[1:])
+
+        weeks.append(days)
+
+    return "".join(page.target_child.strings).strip(), weeks
@@ -13,3 +13,8 @@ Session = sessionmaker(bind=engine)
 Session.expire_on_commit = False
 
 Base.metadata.create_all(engine)
+
+#  create_all не добавляет новые индексы в уже существующие таблицы
+for table in Base.metadata.sorted_tables:
+    for index in table.indexes:
+        index.create(engine, checkfirst=True)
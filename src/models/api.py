@@ -2,7 +2,7 @@ import json
 import mimetypes
 import os.path
 import re
-from typing import Type, TypeVar, List, Optional
+from typing import Type, TypeVar, List, Optional, Dict
 
 import fastapi
 from fastapi import HTTPException
@@ -316,6 +316,65 @@ class Stats(BaseModel):
     online: int
 
 
+class ScheduleBatchRequest(BaseModel):
+    """ Запрос расписаний нескольких групп или преподавателей разом """
+
+    items: List[str]
+    """ Группы и преподаватели """
+
+    overrides: bool = True
+    """ Добавить ли замены """
+
+    @validator
+    def check(self):
+        assert 0 < len(self.items) <= 100, "Можно запросить от 1 до 100 расписаний"
+
+
+class RebuildStatus(BaseModel):
+    """ Состояние фоновой пересборки расписания """
+
+    state: str = "idle"
+    """ idle, running, done или failed """
+
+    queued: bool = False
+    """ После текущей пересборки будет ещё одна """
+
+    stage: Optional[str] = None
+    """ scan, parse, merge или write """
+
+    done: int = 0
+    """ Сколько файлов архива уже разобрано """
+
+    total: int = 0
+    """ Сколько файлов архива надо разобрать """
+
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    timings: Dict[str, float] = {}
+    """ Этап: секунды """
+
+    error: Optional[str] = None
+
+
+class OverridesStatus(BaseModel):
+    """ Состояние фонового обновления замен """
+
+    last_refreshed: Optional[float] = None
+    """ Когда последний раз убедились, что замены актуальны """
+
+    last_checked: Optional[float] = None
+    """ Когда последний раз пробовали их обновить """
+
+    next_check: Optional[float] = None
+
+    sha256: Optional[str] = None
+    """ Хэш PDF, из которого разобраны текущие замены """
+
+    error: Optional[str] = None
+    """ Почему не получилось в последний раз, без traceback. Пока есть ошибка, отдаются старые замены """
+
+
 class Event(BaseModel):
     updateStats: Optional[Stats] = None
     newPost: Optional[IncompletePost] = None
@@ -1,7 +1,7 @@
 import enum
 from typing import Optional
 
-from sqlalchemy import String, Integer, ForeignKey, Boolean, Column, DateTime, func, Enum
+from sqlalchemy import String, Integer, ForeignKey, Boolean, Column, DateTime, func, Enum, Date, Index
 from sqlalchemy.orm import DeclarativeBase, mapped_column
 from sqlalchemy.orm.attributes import Mapped
 
@@ -80,7 +80,7 @@ class DatabaseFile(Base):
     __tablename__ = "files"
 
     id: Mapped[str] = mapped_column(primary_key=True)
-    name: Mapped[str] = Column(String(), nullable=False)
+    name: Mapped[str] = Column(String(), nullable=False, index=True)
 
 
 class DatabaseSettings(Base):
@@ -90,3 +90,47 @@ class DatabaseSettings(Base):
     name: Mapped[str] = Column(String(), nullable=False)
     value: Mapped[str] = Column(String(), nullable=False)
     enabled: Mapped[bool] = Column(Boolean(), nullable=False)
+
+
+class DatabaseOverride(Base):
+    """ Одна замена из zamena.pdf, хранится и после того, как PDF сменился """
+
+    __tablename__ = "overrides"
+    __table_args__ = (
+        Index("overrides_group_date", "group", "date"),
+        Index("overrides_date", "date"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+
+    date = Column(Date(), nullable=False)
+    """ День, на который замена """
+
+    week_num: Mapped[int]
+    week_day: Mapped[int]
+
+    group: Mapped[str]
+
+    position: Mapped[int]
+    """ Порядковый номер замены в PDF """
+
+    override: Mapped[str]
+    """ JSON замены: shouldBe, willBe, index """
+
+
+class DatabaseOverrideTeacher(Base):
+    """ Преподаватель, которого касается замена """
+
+    __tablename__ = "override_teachers"
+    __table_args__ = (
+        Index("override_teachers_teacher_date", "teacher", "date"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+
+    override_id: Mapped[int] = mapped_column(ForeignKey("overrides.id"))
+
+    teacher: Mapped[str]
+    """ Фамилия и инициалы после `normalize` """
+
+    date = Column(Date(), nullable=False)
@@ -1,5 +1,11 @@
-from collections.abc import Callable
-from typing import Optional, Dict
+import asyncio
+import functools
+import os
+import tempfile
+import traceback
+from collections.abc import Awaitable, Callable
+from hashlib import sha256
+from typing import Optional, Dict, Tuple
 
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.requests import Request
@@ -7,10 +13,11 @@ from pydantic.v1 import BaseModel
 from starlette.status import HTTP_204_NO_CONTENT, HTTP_401_UNAUTHORIZED
 
 from src.api_tags import ADMIN_ONLY, FILES
-from src.models.api import Event, AdminType
+from src.models.api import Event, AdminType, RebuildStatus
 from src.routes.admin import admin_login, AdminRequired, siteAdminDependency
 from src.routes.websocket import broadcast_event
-from src.routes.schedule.schedule_parser import update
+from src.routes.schedule.rebuild import rebuild_schedule, current_status
+from src.routes.schedule.overrides_downloader import reparse_file, UPLOADED
 
 fixed_files_router = APIRouter(
     prefix="/fixedfiles",
@@ -20,20 +27,110 @@ fixed_files_router = APIRouter(
 
 class FixedFile(BaseModel):
     name: str
-    post_update: Optional[Callable[[], None]] = None
+    post_update: Optional[Callable[[], Awaitable[None]]] = None
     admin_type: int = AdminType.Site
 
+FIXED_FILES_PATH = "database/fixed_files"
+
 fixed_files: Dict[str, FixedFile] = {
     "zamena": FixedFile(
-        name="zamena.pdf"
+        name="zamena.pdf",
+        #  Клиенты получат updateFile, когда новые замены уже будут в кэше
+        post_update=functools.partial(reparse_file, UPLOADED)
     ),
     "schedule": FixedFile(
         name="schedule.zip",
-        post_update=lambda: update(True),
+        post_update=rebuild_schedule,
         admin_type=AdminType.Schedule
     )
 }
 
+_hashes: Dict[str, Tuple[Tuple[int, int, int], str]] = {}
+"""
+    Ключ: путь к файлу
+
+    Значение: (inode, размер, время изменения) файла и его sha256.
+    Файл мог подменить другой воркер, поэтому хэш годится, только пока stat совпадает
+"""
+
+
+def _stat_key(path: str) -> Optional[Tuple[int, int, int]]:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+def file_hash(path: str) -> Optional[str]:
+    key = _stat_key(path)
+    if key is None:
+        return None
+
+    if path not in _hashes or _hashes[path][0] != key:
+        digest = sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(65536), b""):
+                digest.update(chunk)
+        _hashes[path] = key, digest.hexdigest()
+
+    return _hashes[path][1]
+
+
+async def save_upload(request: Request, path: str) -> Optional[str]:
+    """
+    Пишет тело запроса во временный файл рядом с `path` по кусочкам
+    и атомарно подменяет им `path`.
+
+    Тот, кто читает файл, увидит либо старую версию, либо новую целиком.
+
+    :return: sha256 нового файла или None, если файл не поменялся
+    """
+    digest = sha256()
+
+    with tempfile.NamedTemporaryFile("wb", dir=os.path.dirname(path), delete=False) as f:
+        try:
+            async for chunk in request.stream():
+                digest.update(chunk)
+                f.write(chunk)
+
+            f.flush()
+            os.fsync(f.fileno())
+        except BaseException:
+            f.close()
+            os.remove(f.name)
+            raise
+
+    if digest.hexdigest() == file_hash(path):
+        os.remove(f.name)
+        return None
+
+    if os.path.isfile(path):
+        #  Временный файл создаётся с правами 600
+        os.chmod(f.name, os.stat(path).st_mode & 0o777)
+
+    #  stat временного файла: после os.replace файл по пути мог уже подменить другой воркер
+    _hashes[path] = _stat_key(f.name), digest.hexdigest()
+    os.replace(f.name, path)
+
+    return digest.hexdigest()
+
+
+async def on_file_updated(fixed_file: str, file: FixedFile):
+    """ Обрабатывает загруженный файл и только потом сообщает клиентам """
+    try:
+        if file.post_update:
+            await file.post_update()
+    except Exception:
+        print("Не удалось обработать", file.name, traceback.format_exc())
+        return
+
+    await broadcast_event(Event(
+        updateFile=fixed_file
+    ))
+
+
 @fixed_files_router.patch(
     "/{fixed_file:str}",
     status_code=HTTP_204_NO_CONTENT,
@@ -52,14 +149,18 @@ async def update_file(
     if file.admin_type != admin.type:
         raise HTTPException(status_code=HTTP_401_UNAUTHORIZED)
 
-    with open(f"database/fixed_files/{file.name}", "wb") as f:
-        f.write(await request.body())
+    if await save_upload(request, f"{FIXED_FILES_PATH}/{file.name}") is None:
+        #  Загрузили то же самое, пересобирать нечего
+        return None
 
-    if file.post_update:
-        file.post_update()
-    
-    await broadcast_event(Event(
-        updateFile=fixed_file
-    ))
+    asyncio.create_task(on_file_updated(fixed_file, file))
 
     return None
+
+
+@fixed_files_router.get(
+    "/schedule/rebuild",
+    name="Состояние пересборки расписания"
+)
+async def get_rebuild_status() -> RebuildStatus:
+    return current_status()
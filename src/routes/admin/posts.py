@@ -12,6 +12,7 @@ from ...database import Session, FILES_PATH
 from ...models.api import PrivatePost, PostablePost, IncompletePost, Event
 from ...models.database import DatabasePost, PostStatus, DatabaseFile
 from ...routes.admin import siteAdminDependency
+from ...routes import file_metadata
 from ...routes.websocket import broadcast_event
 
 posts_router = APIRouter(
@@ -59,6 +60,7 @@ def cleanup_files():
             if not real_file in database_files:
                 os.remove(f"{FILES_PATH}/{real_file}")
                 session.query(DatabaseFile).filter(DatabaseFile.id == real_file).delete()
+                file_metadata.forget(real_file)
                 counter += 1
 
         if counter > 0:
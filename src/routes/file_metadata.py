@@ -0,0 +1,84 @@
+import os
+from typing import Dict, NamedTuple, Optional
+
+from sqlalchemy import select
+
+from ..database import Session, FILES_PATH
+from ..models.api import File
+from ..models.database import DatabaseFile
+
+
+class FileMetadata(NamedTuple):
+    """ Всё, что нужно для ответа `get_file`, без обращения к базе """
+    id: str
+    """ sha256 содержимого """
+
+    name: str
+    mime: str
+
+    stat: os.stat_result
+    """ Размер и время изменения для заголовков ответа """
+
+
+_by_id: Dict[str, FileMetadata] = {}
+""" Ключ: ID файла """
+
+_by_name: Dict[str, FileMetadata] = {}
+""" Ключ: имя, по которому файл запросили вместо ID """
+
+
+def lookup(file_id: str, file_name: str) -> Optional[FileMetadata]:
+    """ Файл по ID или по имени, как в `get_file`. Найденное запоминается """
+    metadata = _by_id.get(file_id) or _by_name.get(file_name)
+    if metadata:
+        #  Файл мог удалить другой воркер, а `forget` чистит только кэш своего
+        try:
+            return metadata._replace(stat=os.stat(f"{FILES_PATH}/{metadata.id}"))
+        except FileNotFoundError:
+            forget(metadata.id)
+
+    with Session.begin() as session:
+        by_id = session.scalar(
+            select(DatabaseFile)
+            .where(DatabaseFile.id == file_id)
+        )
+        db_file = by_id or session.scalar(
+            select(DatabaseFile)
+            .where(DatabaseFile.name == file_name)
+        )
+
+        if not db_file:
+            return None
+
+        file = File.from_database(db_file)
+
+    try:
+        stat = os.stat(f"{FILES_PATH}/{file.id}")
+    except FileNotFoundError:
+        return None
+
+    metadata = FileMetadata(file.id, file.name, file.mime, stat)
+
+    if by_id:
+        _by_id[file_id] = metadata
+    else:
+        _by_name[file_name] = metadata
+
+    return metadata
+
+
+def forget(file_id: str, file_name: Optional[str] = None):
+    """
+    Убирает файл из кэша `get_file`.
+
+    Вызывается при загрузке (под тем же именем мог быть другой файл)
+    и при удалении файла.
+    """
+    _by_id.pop(file_id, None)
+
+    if file_name is not None:
+        _by_name.pop(file_name, None)
+
+    for name, metadata in list(_by_name.items()):
+        if metadata.id == file_id:
+            del _by_name[name]
@@ -13,8 +13,9 @@ from sqlalchemy import select
 from .admin.fixed_files import fixed_files
 from ..api_tags import FILES, ADMIN_ONLY
 from ..database import Session, FILES_PATH
-from ..models.api import File, mime_of
+from ..models.api import mime_of
 from ..models.database import DatabaseFile
+from . import file_metadata
 from ..routes.admin import AdminRequired
 
 files_router = APIRouter(
@@ -31,7 +32,7 @@ async def get_fixed_file(fixed_file: str):
     if not fixed_file in fixed_files:
         return None
 
-    file_name = fixed_files[fixed_file]
+    file_name = fixed_files[fixed_file].name
     path = f"database/fixed_files/{file_name}"
 
     return FileResponse(
@@ -94,6 +95,8 @@ async def upload(
             name=filename,
         ))
 
+    file_metadata.forget(file_hash, filename)
+
     return { "id": file_hash }
 
 
@@ -107,23 +110,15 @@ async def get_file(file_name: str):
     """
     file_id = file_name.split(".", 1)[0]
 
-    with Session.begin() as session:
-        db_file = session.scalar(
-            select(DatabaseFile)
-            .where(DatabaseFile.id == file_id)
-        ) or session.scalar(
-            select(DatabaseFile)
-            .where(DatabaseFile.name == file_name)
-        )
-
-        if not db_file:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    file = file_metadata.lookup(file_id, file_name)
 
-        file = File.from_database(db_file)
+    if not file:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
 
     return FileResponse(
         f"{FILES_PATH}/{file.id}",
         filename=file.name,
         media_type=file.mime,
-        content_disposition_type="inline"
+        content_disposition_type="inline",
+        stat_result=file.stat
     )
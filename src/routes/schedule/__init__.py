@@ -1,14 +1,21 @@
+import datetime
 import json
 import os
-from typing import List, Dict
+from typing import List, Dict, Optional
 
 from ...api_tags import SCHEDULE
 
-from fastapi import APIRouter, Response, status, Request
+from fastapi import APIRouter, Depends, Response, status, Request, HTTPException
+from . import overrides_downloader
+from . import overrides_history
+from . import effective
 from .overrides_downloader import download_overrides
-from .schedule_parser import items, cache, update, get_html
+from . import schedule_parser
+from .schedule_parser import update
 update()
 from .teacher_overrides import teacher_overrides
+from .response_cache import encode_json, respond_once
+from ...models.api import ScheduleBatchRequest, OverridesStatus
 from fastapi.responses import FileResponse
 
 
@@ -25,9 +32,16 @@ if not os.path.isfile("applications/updates.json"):
     with open("applications/updates.json", "w") as f:
         f.write("{}")
 
+async def _current_schedule():
+    #  В цикле событий, а не в пуле потоков: обычно это одно сравнение времени
+    schedule_parser.reload_if_changed()
+
+
 schedule_router = APIRouter(
     prefix="/schedule",
-    tags=[SCHEDULE]
+    tags=[SCHEDULE],
+    lifespan=overrides_downloader.lifespan,
+    dependencies=[Depends(_current_schedule)]
 )
 
 
@@ -36,15 +50,131 @@ schedule_router = APIRouter(
     name="Получить список групп и преподавателей"
 )
 async def get_items() -> Dict[str, List[str]]:
-    return items
+    return schedule_parser.cache.item_lists
+
+
+@schedule_router.get(
+    "/items/search",
+    name="Найти группу или преподавателя"
+)
+async def search_items(q: str, limit: int = 10) -> List[str]:
+    """
+    Ищет по началу названия без учёта регистра и дефисов,
+    прощает одну опечатку в фамилии преподавателя.
+    """
+    return schedule_parser.cache.search.search(q, min(limit, 50))
+
+
+@schedule_router.get(
+    "/changes",
+    name="Получить изменения расписания"
+)
+async def get_changes(since: int, request: Request):
+    """
+    Расписания, которые поменялись после поколения `since`.
+
+    ```
+    {
+        "generation": 12,      # Текущее поколение, его нужно передать в следующий раз
+        "full": false,         # true - since слишком старое, нужно скачать всё заново
+        "removed": ["Д-1-1"],  # Больше нет
+        "items": {...},        # Новые расписания целиком
+        "days": {"Д-1-2": [{"weekNum": 0, "weekDay": 3, "lessons": [...]}]}
+    }
+    ```
+    """
+    return schedule_parser.cache.changes_response(since).respond(request)
+
+
+@schedule_router.get(
+    "/rooms",
+    name="Получить список кабинетов"
+)
+async def get_rooms(request: Request):
+    return schedule_parser.cache.room_list.respond(request)
+
+
+@schedule_router.get(
+    "/rooms/free",
+    name="Найти свободные кабинеты"
+)
+async def get_free_rooms(
+        week: int,
+        day: int,
+        lesson: int,
+        lesson_to: Optional[int] = None
+) -> List[str]:
+    """
+    Кабинеты, свободные на паре `lesson` (или на всех парах с `lesson` по `lesson_to`).
+
+    Нумерация недель, дней и пар с нуля, как в weekNum, weekDay и index.
+    Если на этот день уже есть замены, они учитываются.
+    """
+    lesson_to = lesson if lesson_to is None else lesson_to
+    occupancy = schedule_parser.cache.occupancy
+
+    if not occupancy.contains(week, day, lesson, lesson_to):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST)
+
+    return occupancy.free(
+        week, day, lesson, lesson_to,
+        overrides_downloader.cache
+    )
+
+
+@schedule_router.get(
+    "/rooms/{room:path}/schedule",
+    name="Получить занятия в кабинете"
+)
+async def get_room_schedule(room: str, request: Request):
+    response = schedule_parser.cache.room(room)
+
+    if response is None:
+        return _not_found
+
+    return response.respond(request)
 
 
 @schedule_router.get(
     "/{item_name:str}/schedule",
     name="Получить расписание"
 )
-async def get_schedule(item_name: str):
-    return cache.get(item_name, _not_found)
+async def get_schedule(item_name: str, request: Request):
+    response = schedule_parser.cache.response(item_name)
+
+    if response is None:
+        return _not_found
+
+    return response.respond(request)
+
+
+@schedule_router.get(
+    "/overrides/status",
+    name="Состояние обновления замен"
+)
+async def get_overrides_status() -> OverridesStatus:
+    return overrides_downloader.status
+
+
+@schedule_router.get(
+    "/{item_name:str}/effective",
+    name="Получить расписание на день с заменами"
+)
+async def get_effective(item_name: str, date: datetime.date, request: Request):
+    """
+    Пары на `date` из расписания, поверх которых применены замены на этот день.
+
+    `overridden` - номера пар, которые поменялись.
+    """
+    #  Номер недели считается от дня текущих замен, поэтому они нужны загруженными
+    await download_overrides("")
+
+    response = effective.response(item_name, date)
+
+    if response is None:
+        return _not_found
+
+    return response.respond(request)
 
 
 @schedule_router.get(
@@ -52,7 +182,64 @@ async def get_schedule(item_name: str):
     name="Получить изменения"    
 )
 async def get_overrides(item_name: str):
-    return download_overrides(item_name) if '-' in item_name else teacher_overrides(item_name)
+    return await overrides_for(item_name)
+
+
+@schedule_router.get(
+    "/{item_name:str}/overrides/history",
+    name="Получить прошлые изменения"
+)
+async def get_overrides_history(item_name: str, since: datetime.date, until: datetime.date) -> List[dict]:
+    """
+    Замены группы или преподавателя по дням с `since` по `until` включительно, не больше чем за год.
+
+    Дни без замен пропускаются.
+    """
+    if until < since or (until - since).days > 366:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST)
+
+    if '-' in item_name:
+        return overrides_history.group_history(item_name, since, until)
+
+    return overrides_history.teacher_history(item_name, since, until)
+
+
+async def overrides_for(item_name: str) -> dict:
+    return await (download_overrides(item_name) if '-' in item_name else teacher_overrides(item_name))
+
+
+@schedule_router.post("/batch", name="Получить несколько расписаний")
+async def get_batch(batch: ScheduleBatchRequest, request: Request):
+    """
+    Расписания (и замены) нескольких групп или преподавателей одним ответом:
+    `{"Д-1-1": {"schedule": ..., "overrides": ...}}`.
+    Если расписания нет, schedule будет null,
+    если замены ещё не загружены, overrides будет null.
+    """
+    batch.check()
+
+    parts = []
+
+    #  Расписания уже лежат закодированными, поэтому ответ склеивается из готовых байтов
+    for item_name in dict.fromkeys(batch.items):
+        response = schedule_parser.cache.response(item_name)
+
+        part = encode_json(item_name) + b':{"schedule":' + (response.body if response else b"null")
+
+        if batch.overrides:
+            try:
+                overrides = encode_json(await overrides_for(item_name))
+            except HTTPException as e:
+                #  Без замен расписания всё равно нужны
+                if e.status_code != status.HTTP_503_SERVICE_UNAVAILABLE:
+                    raise
+                overrides = b"null"
+
+            part += b',"overrides":' + overrides
+
+        parts.append(part + b"}")
+
+    return respond_once(request, b"{" + b",".join(parts) + b"}")
 
 
 @schedule_router.get("/{platform:str}/updates", name="Получить информацию о последней версии приложения")
@@ -79,5 +266,10 @@ async def receive_crash_log(request: Request):
     print((await request.body()).decode())
 
 @schedule_router.get("/{item_name:str}/schedule.html", name="Получить HTML расписания")
-async def get_html_(item_name):
-    return Response(get_html(item_name) or "")
+async def get_html_(item_name: str, request: Request):
+    page = schedule_parser.cache.page(item_name)
+
+    if page is None:
+        return Response("")
+
+    return page.respond(request)
@@ -0,0 +1,196 @@
+"""
+Замер скорости разбора schedule.zip.
+
+    python -m src.routes.schedule.benchmark --rounds 3 --output bench.json
+
+В stdout (и в `--output`) пишется один JSON отчёт, всё остальное уходит в stderr,
+поэтому отчёты разных запусков можно сравнивать программно.
+
+`update(True)` пишет результат во временную папку, данные сервера не меняются.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+from typing import Callable, Dict, List
+
+from bs4 import BeautifulSoup
+
+from parsers.schedule_page import ENGINES, build_schedule, walk_soup
+from ...models.api import RebuildStatus
+from . import schedule_parser
+
+ARCHIVE = "database/fixed_files/schedule.zip"
+
+
+def _measure(function: Callable[[], object]) -> int:
+    """ Пиковая память в байтах, которую выделил `function` """
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _parse_round(archive: zipfile.ZipFile, files: List[str], engine: str) -> Dict[str, float]:
+    """ Разбирает все файлы как `process_file`, но отдельно засекает каждый этап """
+    stages = dict.fromkeys(("zip_read", "decode", "tree", "walk", "read", "build"), 0.0)
+
+    for file in files:
+        start = time.perf_counter()
+        data = archive.read(file)
+        stages["zip_read"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        html = data.decode("windows-1251")
+        stages["decode"] += time.perf_counter() - start
+
+        if engine == "soup":
+            #  Построение дерева и обход таблиц отдельно
+            start = time.perf_counter()
+            soup = BeautifulSoup(html, "html.parser")
+            stages["tree"] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            page = walk_soup(soup)
+            stages["walk"] += time.perf_counter() - start
+        else:
+            start = time.perf_counter()
+            page = ENGINES[engine](html)
+            stages["read"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        build_schedule(*page)
+        stages["build"] += time.perf_counter() - start
+
+    return {stage: seconds for stage, seconds in stages.items() if seconds}
+
+
+def bench_parse(engine: str, rounds: int) -> dict:
+    archive = zipfile.ZipFile(ARCHIVE)
+    files = [file for file in archive.namelist() if file.endswith(".html")]
+
+    results = [_parse_round(archive, files, engine) for _ in range(rounds)]
+    #  Лучший из замеров меньше всего зависит от соседних процессов
+    best = min(results, key=lambda stages: sum(stages.values()))
+    total = sum(best.values())
+
+    return dict(
+        files=len(files),
+        total=round(total, 4),
+        files_per_sec=round(len(files) / total, 1),
+        stages={stage: round(seconds, 4) for stage, seconds in best.items()},
+        peak_memory=_measure(lambda: _parse_round(archive, files, engine))
+    )
+
+
+def _update_round(workers: int, incremental: bool) -> RebuildStatus:
+    if not incremental and os.path.isfile(schedule_parser.MANIFEST):
+        #  Без манифеста разбирается каждый файл, после пересборки он появится снова
+        os.remove(schedule_parser.MANIFEST)
+
+    status = RebuildStatus()
+
+    start = time.perf_counter()
+    schedule_parser.update(True, workers, status)
+    status.timings["total"] = time.perf_counter() - start
+
+    return status
+
+
+@contextlib.contextmanager
+def _scratch_directory():
+    """
+    Временная рабочая папка с копией schedule.zip.
+
+    `update` пишет манифест, schedule.json и остальное в текущую папку,
+    в папке сервера это были бы его настоящие данные.
+    """
+    archive = os.path.abspath(ARCHIVE)
+    cwd = os.getcwd()
+    #  `update` подменяет их на прочитанные из временной папки
+    old_archive, old_cache = schedule_parser._archive, schedule_parser.cache
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.makedirs(os.path.join(directory, os.path.dirname(ARCHIVE)))
+        shutil.copyfile(archive, os.path.join(directory, ARCHIVE))
+
+        os.chdir(directory)
+        try:
+            yield
+        finally:
+            os.chdir(cwd)
+            schedule_parser._archive, schedule_parser.cache = old_archive, old_cache
+
+
+def bench_update(workers: int, rounds: int, incremental: bool) -> dict:
+    with _scratch_directory():
+        if incremental:
+            #  Манифест, по которому пересобирается только изменившееся
+            _update_round(workers, False)
+
+        statuses = [_update_round(workers, incremental) for _ in range(rounds)]
+        best = min(statuses, key=lambda status: status.timings["total"])
+
+        report = dict(
+            workers=workers,
+            incremental=incremental,
+            files=best.total,
+            total=round(best.timings["total"], 4),
+            files_per_sec=round(best.total / best.timings["total"], 1),
+            stages={stage: round(seconds, 4) for stage, seconds in best.timings.items() if stage != "total"}
+        )
+
+        if workers <= 1:
+            #  Память дочерних процессов tracemalloc не видит
+            report["peak_memory"] = _measure(lambda: _update_round(workers, incremental))
+
+    return report
+
+
+def main(args: List[str]):
+    parser = argparse.ArgumentParser(description="Замер скорости разбора schedule.zip")
+    parser.add_argument("--rounds", type=int, default=3, help="Сколько раз повторить каждый замер")
+    parser.add_argument(
+        "--engine", action="append", choices=list(ENGINES),
+        help="Чем читать страницы, по умолчанию сравниваются все"
+    )
+    parser.add_argument("--workers", type=int, default=1, help="Процессов для update(True)")
+    parser.add_argument("--incremental", action="store_true", help="Замерить пересборку, когда архив не менялся")
+    parser.add_argument("--no-update", action="store_true", help="Замерить только разбор страниц")
+    parser.add_argument("--output", help="Куда ещё записать отчёт")
+    options = parser.parse_args(args)
+
+    report = dict(
+        python=platform.python_version(),
+        cpu_count=os.cpu_count(),
+        rounds=options.rounds,
+        parse={}
+    )
+
+    #  Прогресс и вывод парсера не должны попасть в отчёт
+    with contextlib.redirect_stdout(sys.stderr):
+        for engine in options.engine or ENGINES:
+            report["parse"][engine] = bench_parse(engine, options.rounds)
+
+        if not options.no_update:
+            report["update"] = bench_update(options.workers, options.rounds, options.incremental)
+
+    encoded = json.dumps(report, indent=2)
+    print(encoded)
+
+    if options.output:
+        with open(options.output, "w") as f:
+            f.write(encoded)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,27 +1,69 @@
 import os.path
+import tempfile
+from hashlib import sha256
+from typing import Dict, NamedTuple, Optional
 
 import requests
 
 dir = "/tmp/kotyarick/schedule-parser/"
 
+TIMEOUT = 30
+""" Сколько секунд ждать ответа сервера """
+
+session = requests.Session()
+""" Соединения с сервером переиспользуются между скачиваниями """
+
+validators: Dict[str, Dict[str, str]] = {}
+"""
+    Ключ: URL
+
+    Значение: заголовки условного запроса для версии, которая у нас уже есть
+"""
+
+
+class Download(NamedTuple):
+    path: str
+    """ Временный файл, удалить его должен вызывающий """
+
+    sha256: str
+
+    validators: Dict[str, str]
+    """ Запомнить в `validators`, когда файл будет обработан """
+
 
 #  Скачивает файл в оперативку
 #  по заданному URL.
-#  Возвращает полный путь к файлу
-def download_file(url):
+#  Возвращает None, если с прошлого раза файл не поменялся
+def fetch(url: str, conditional: bool = True) -> Optional[Download]:
     if not os.path.isdir(dir):
         os.makedirs(dir)
-    local_filename = dir + url.split('/')[-1]
 
-    #  Если файл уже скачан, используем его
-    if os.path.isfile(local_filename):
-        return local_filename
+    headers = validators.get(url, {}) if conditional else {}
 
     #  Скачиваем файл по 8192 байта (128 килобайт)
-    with requests.get(url, stream=True) as r:
+    with session.get(url, stream=True, headers=headers, timeout=TIMEOUT) as r:
+        if r.status_code == requests.codes.not_modified:
+            return None
+
         r.raise_for_status()
-        with open(local_filename, 'wb') as f:
-            for chunk in r.iter_content(chunk_size=8192):
-                f.write(chunk)
 
-    return local_filename
+        digest = sha256()
+
+        with tempfile.NamedTemporaryFile("wb", dir=dir, suffix=url.split('/')[-1], delete=False) as f:
+            try:
+                for chunk in r.iter_content(chunk_size=8192):
+                    digest.update(chunk)
+                    f.write(chunk)
+            except BaseException:
+                f.close()
+                os.remove(f.name)
+                raise
+
+        new_validators = {}
+        if "ETag" in r.headers:
+            new_validators["If-None-Match"] = r.headers["ETag"]
+        if "Last-Modified" in r.headers:
+            new_validators["If-Modified-Since"] = r.headers["Last-Modified"]
+
+    return Download(f.name, digest.hexdigest(), new_validators)
+
@@ -0,0 +1,138 @@
+import datetime
+import functools
+from typing import Dict, List, Optional
+
+from . import overrides_downloader, overrides_history, schedule_parser
+from .overrides_history import overrides_date
+from .response_cache import CachedResponse
+
+
+def _day_overrides(item: str, date: datetime.date, today: datetime.date) -> Optional[dict]:
+    """ Замены на `date`: текущие из PDF или сохранённые в истории """
+    group = '-' in item
+
+    if date == today:
+        if group:
+            return overrides_downloader.cache.get(item)
+
+        return overrides_downloader.teachers.get(item)
+
+    history = (overrides_history.group_history if group else overrides_history.teacher_history)(item, date, date)
+
+    return history[0] if history else None
+
+
+def effective_day(item: str, date: datetime.date) -> Optional[dict]:
+    """
+    Пары группы или преподавателя на `date` с учётом замен.
+
+    Номер недели считается от дня, на который выложены текущие замены:
+    недели в расписании чередуются по порядку.
+
+    :return: None, если такой группы или преподавателя нет
+    """
+    if item not in schedule_parser.cache:
+        return None
+
+    weeks = schedule_parser.cache[item]["weeks"]
+
+    anchor = next(iter(overrides_downloader.cache.values()))
+    today = overrides_date(anchor)
+
+    #  Сколько недель прошло между понедельниками
+    monday = date - datetime.timedelta(days=date.weekday())
+    today_monday = today - datetime.timedelta(days=today.weekday())
+    week_num = (anchor["weekNum"] + (monday - today_monday).days // 7) % len(weeks)
+    week_day = date.weekday()
+
+    days = weeks[week_num]["days"]
+    lessons = list(days[week_day]["lessons"]) if week_day < len(days) else []
+
+    overrides = _day_overrides(item, date, today)
+
+    #  Номер пары: чем её заменили
+    replaced: Dict[int, List[dict]] = {}
+    for override in overrides["overrides"] if overrides else []:
+        replaced.setdefault(override["index"], [])
+
+        if override["willBe"]:
+            replaced[override["index"]].append(override["willBe"])
+
+    for index, will_be in replaced.items():
+        lessons.extend([None] * (index + 1 - len(lessons)))
+        lessons[index] = _merge(will_be, item)
+
+    return dict(
+        date=date.isoformat(),
+        weekNum=week_num,
+        weekDay=week_day,
+        lessons=lessons,
+        overridden=sorted(replaced)
+    )
+
+
+def _merge(lessons: List[dict], item: str) -> Optional[dict]:
+    """
+    Замены на одну пару - одна пара в том же виде, что и в schedule.json.
+
+    Несколько замен (обычно по подгруппам) или замена для одной подгруппы
+    становятся парой с подгруппами.
+    """
+    if not lessons:
+        return None
+
+    group = lessons[0].get("group", item)
+
+    parts = [
+        part
+        for lesson in lessons
+        for part in (
+            [lesson["commonLesson"]] if lesson.get("commonLesson") else lesson["subgroupedLesson"]["subgroups"]
+        )
+    ]
+
+    if len(parts) == 1 and parts[0].get("subgroup_index") is None:
+        name, teacher, room = parts[0]["name"], parts[0]["teacher"] or "", _room(parts[0]["room"])
+
+        if '-' in item:
+            return dict(commonLesson=dict(name=name, teacher=teacher, room=room), group=group)
+
+        #  Порядок ключей как в расписании преподавателя
+        return dict(group=group, commonLesson=dict(name=name, room=room, teacher=teacher))
+
+    return dict(
+        subgroupedLesson=dict(
+            name=parts[0]["name"],
+            subgroups=[
+                dict(
+                    teacher=part["teacher"] or "",
+                    room=_room(part["room"]),
+                    subgroup_index=part.get("subgroup_index") or index + 1
+                )
+                for index, part in enumerate(parts)
+            ]
+        ),
+        group=group
+    )
+
+
+def _room(room: Optional[str]) -> str:
+    #  В PDF несколько кабинетов пишутся в столбик
+    return ", ".join(line.strip() for line in (room or "").split("\n") if line.strip())
+
+
+@functools.lru_cache(512)
+def _response(item: str, date: datetime.date, _generation: int, _overrides: Optional[str]) -> Optional[CachedResponse]:
+    """ Поколение расписания и хэш замен нужны только как часть ключа """
+    day = effective_day(item, date)
+
+    return None if day is None else CachedResponse.from_json(day)
+
+
+def response(item: str, date: datetime.date) -> Optional[CachedResponse]:
+    """
+    `effective_day` в готовом для отдачи виде.
+
+    Запоминается, пока не сменится расписание или PDF с заменами.
+    """
+    return _response(item, date, schedule_parser.cache.generation, overrides_downloader.status.sha256)
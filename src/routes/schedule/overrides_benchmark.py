@@ -0,0 +1,207 @@
+"""
+Замер скорости и проверка результата разбора zamena.pdf.
+
+    python -m src.routes.schedule.overrides_benchmark --rounds 3 --output bench.json
+
+Каждый PDF из `CORPUS` разбирается и сравнивается с JSON рядом с ним
+(`2025-11-07.pdf` -> `2025-11-07.json`). Если результат разошёлся с ожидаемым,
+расхождения попадают в отчёт, а процесс завершается с кодом 1.
+Если разбор поменялся намеренно, ожидания переписываются флагом `--update`.
+
+Новый PDF добавляется в `CORPUS` под датой, на которую он выложен:
+
+    python -m src.routes.schedule.overrides_benchmark --add zamena.pdf --no-bench
+
+В stdout (и в `--output`) пишется один JSON отчёт, всё остальное уходит в stderr.
+"""
+import argparse
+import contextlib
+import glob
+import json
+import os
+import platform
+import shutil
+import sys
+import time
+from typing import Dict, List, Optional
+
+import pdfplumber
+
+from . import overrides_parser
+from .benchmark import _measure
+from .overrides_history import overrides_date
+
+CORPUS = "database/overrides_corpus"
+
+
+def _expectation(path: str) -> str:
+    return os.path.splitext(path)[0] + ".json"
+
+
+def _parse_round(path: str, workers: int) -> Dict[str, float]:
+    """ Разбирает PDF как `parse_overrides`, но отдельно засекает каждый этап """
+    stages = {}
+
+    start = time.perf_counter()
+    with pdfplumber.open(path) as pdf:
+        header = overrides_parser.read_header(pdf)
+        pages = len(pdf.pages)
+    stages["header"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    rows = overrides_parser.extract_rows(path, pages, workers)
+    stages["extract"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    overrides_parser.build_overrides(rows, header)
+    stages["cells"] = time.perf_counter() - start
+
+    return stages
+
+
+def bench_file(path: str, rounds: int, workers: int) -> dict:
+    with pdfplumber.open(path) as pdf:
+        pages = len(pdf.pages)
+
+    results = [_parse_round(path, workers) for _ in range(rounds)]
+    #  Лучший из замеров меньше всего зависит от соседних процессов
+    best = min(results, key=lambda stages: sum(stages.values()))
+    total = sum(best.values())
+
+    report = dict(
+        pages=pages,
+        total=round(total, 4),
+        pages_per_sec=round(pages / total, 1),
+        stages={stage: round(seconds, 4) for stage, seconds in best.items()}
+    )
+
+    if workers <= 1:
+        #  Память дочерних процессов tracemalloc не видит
+        report["peak_memory"] = _measure(lambda: _parse_round(path, workers))
+
+    return report
+
+
+def diff(expected: Dict[str, dict], actual: Dict[str, dict]) -> List[str]:
+    """ Чем `actual` отличается от `expected`, по строке на расхождение """
+    differences = []
+
+    for group in expected.keys() - actual.keys():
+        differences.append(f"{group}: группа пропала")
+
+    for group in actual.keys() - expected.keys():
+        differences.append(f"{group}: лишняя группа")
+
+    for group in expected.keys() & actual.keys():
+        old, new = expected[group], actual[group]
+
+        for key in old.keys() | new.keys():
+            if key != "overrides" and old.get(key) != new.get(key):
+                differences.append(f"{group}.{key}: {old.get(key)!r} -> {new.get(key)!r}")
+
+        old_overrides, new_overrides = old.get("overrides", []), new.get("overrides", [])
+
+        if len(old_overrides) != len(new_overrides):
+            differences.append(f"{group}: {len(old_overrides)} замен -> {len(new_overrides)}")
+
+        for position, (was, now) in enumerate(zip(old_overrides, new_overrides)):
+            if was != now:
+                differences.append(
+                    f"{group}[{position}]: "
+                    f"{json.dumps(was, ensure_ascii=False)} -> {json.dumps(now, ensure_ascii=False)}"
+                )
+
+    return sorted(differences)
+
+
+def check_file(path: str, update: bool) -> Optional[List[str]]:
+    """
+    Сравнивает разбор `path` с сохранённым.
+
+    :return: None, если ожидаемого результата ещё нет, иначе список расхождений
+    """
+    #  Через JSON, чтобы сравнивать ровно то, что видят клиенты
+    actual = json.loads(json.dumps(overrides_parser.parse_overrides(path, workers=1)))
+    expectation = _expectation(path)
+
+    if update:
+        with open(expectation, "w") as f:
+            json.dump(actual, f, ensure_ascii=False, indent=1)
+
+    if not os.path.isfile(expectation):
+        return None
+
+    with open(expectation) as f:
+        return diff(json.load(f), actual)
+
+
+def add_file(path: str) -> str:
+    """
+    Копирует PDF в `CORPUS` под датой с его первой страницы.
+
+    :return: Путь к копии
+    """
+    with pdfplumber.open(path) as pdf:
+        header = overrides_parser.read_header(pdf)
+
+    if header is None:
+        raise ValueError(f"В {path} нет даты замен")
+
+    copy = f"{CORPUS}/{overrides_date(header._asdict()).isoformat()}.pdf"
+    shutil.copyfile(path, copy)
+
+    return copy
+
+
+def main(args: List[str]):
+    parser = argparse.ArgumentParser(description="Замер скорости и проверка разбора zamena.pdf")
+    parser.add_argument("files", nargs="*", help=f"Какие PDF разобрать, по умолчанию все из {CORPUS}")
+    parser.add_argument("--rounds", type=int, default=3, help="Сколько раз повторить каждый замер")
+    parser.add_argument("--workers", type=int, default=1, help="Процессов для извлечения таблиц")
+    parser.add_argument("--update", action="store_true", help="Записать текущий разбор как ожидаемый")
+    parser.add_argument(
+        "--add", action="append", default=[],
+        help="Добавить PDF в корпус, его текущий разбор станет ожидаемым"
+    )
+    parser.add_argument("--no-bench", action="store_true", help="Только сравнить с ожидаемым")
+    parser.add_argument("--output", help="Куда ещё записать отчёт")
+    options = parser.parse_args(args)
+
+    report = dict(
+        python=platform.python_version(),
+        cpu_count=os.cpu_count(),
+        rounds=options.rounds,
+        workers=options.workers,
+        files={}
+    )
+    failed = False
+
+    #  Вывод парсера не должен попасть в отчёт
+    with contextlib.redirect_stdout(sys.stderr):
+        added = [add_file(path) for path in options.add]
+
+        for path in options.files or added or sorted(glob.glob(f"{CORPUS}/*.pdf")):
+            result = {}
+
+            if not options.no_bench:
+                result.update(bench_file(path, options.rounds, options.workers))
+
+            differences = check_file(path, options.update or path in added)
+            result["differences"] = differences
+            failed = failed or bool(differences)
+
+            report["files"][os.path.basename(path)] = result
+
+    encoded = json.dumps(report, indent=2, ensure_ascii=False)
+    print(encoded)
+
+    if options.output:
+        with open(options.output, "w") as f:
+            f.write(encoded)
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,8 +1,23 @@
+import asyncio
 import os
-from datetime import datetime
+import time
+import traceback
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from hashlib import sha256
+from typing import Optional
 
-from .downloader import download_file
-from .overrides_parser import parse_overrides
+import pdfplumber
+from fastapi import HTTPException
+from starlette.status import HTTP_503_SERVICE_UNAVAILABLE
+
+from ...models.api import OverridesStatus
+from ...utils import config
+from . import downloader
+from . import overrides_history
+from .overrides_history import overrides_date
+from .overrides_parser import parse_overrides, read_header
+from .teacher_overrides import TeacherOverrides
 
 """
     Ключ: ID группы
@@ -11,31 +26,228 @@ from .overrides_parser import parse_overrides
 """
 cache = {}
 
-#  Когда последний раз получали изменения
-last_time_retrieved = None
-
-def download_overrides(group_id: str):
-    global last_time_retrieved, cache
-
-    now = datetime.now()
-
-    #  Если изменения не были полученны...
-    if (last_time_retrieved is None)\
-        or (
-            #  или они были полученны сегодня, 
-            last_time_retrieved.day == now.day \
-            #  но сейчас >=15 часов, поэтому новые изменения были выставленны
-            and now.hour >= 15\
-            #  и мы их ещё не видели...
-            and last_time_retrieved.hour < 15\
-        ) or (
-        #  или изменения были полученны вчера или ранее
-        last_time_retrieved.day != now.day):
-            #  ...то нам надо получить изменения
-            filename = download_file("https://ttgt.org/images/pdf/zamena.pdf")
-            cache = parse_overrides()
-            os.system(f"rm {filename}")
-            last_time_retrieved = now
+teachers = TeacherOverrides(cache)
+""" Замены из `cache` по преподавателям """
+
+status = OverridesStatus()
+""" Как прошла последняя проверка замен, `status.sha256` - хэш PDF, из которого `cache` """
+
+UPLOADED = "database/fixed_files/zamena.pdf"
+""" PDF, который загрузил админ, см. `admin.fixed_files` """
+
+_uploaded = False
+""" `cache` из PDF, который загрузил админ, а не скачан с сайта """
+
+_network_sha256: Optional[str] = None
+""" Хэш того, что последний раз скачали с сайта, даже если отдаются замены из загруженного PDF """
+
+_refresher: Optional[asyncio.Task] = None
+
+_refreshing: Optional[asyncio.Task] = None
+""" Обновление, которое идёт прямо сейчас """
+
+_lock = asyncio.Lock()
+""" Замены из сети и из загруженного файла разбираются по очереди """
+
+RETRY = 60
+""" Через сколько секунд запрос может снова попробовать скачать замены, которых нет """
+
+
+def _settings() -> dict:
+    return config.get("overrides", {})
+
+
+def refresh():
+    """
+    Скачивает и разбирает замены.
+
+    Если сервер ответил, что PDF не менялся, или скачался тот же самый файл, что и в прошлый раз,
+    заново он не разбирается.
+    Замены, которые загрузил админ, заменяются скачанными, только если те на более поздний день.
+    Если скачать или разобрать не получилось, остаются старые замены.
+    """
+    global _network_sha256
+
+    status.last_checked = time.time()
+    url = _settings().get("url", "https://ttgt.org/images/pdf/zamena.pdf")
+
+    try:
+        download = downloader.fetch(url, conditional=_network_sha256 is not None)
+
+        if download is not None:
+            try:
+                if download.sha256 != _network_sha256 and _newer_than_upload(download.path):
+                    _apply(download.path, download.sha256, uploaded=False)
+            finally:
+                os.remove(download.path)
+
+            _network_sha256 = download.sha256
+            downloader.validators[url] = download.validators
+    except Exception as e:
+        print("Не удалось обновить замены", traceback.format_exc())
+        #  Состояние видно без входа, поэтому traceback с путями сервера остаётся только в логе
+        status.error = str(e) or type(e).__name__
+        return
+
+    status.last_refreshed = time.time()
+    status.error = None
+
+
+def load_file(path: str):
+    """
+    Замены из PDF, который загрузил админ, без скачивания.
+
+    Если разобрать не получилось, остаются старые замены, а ошибка пробрасывается дальше.
+    """
+    with open(path, "rb") as f:
+        _apply(path, sha256(f.read()).hexdigest(), uploaded=True)
+
+    status.last_refreshed = time.time()
+    status.error = None
+
+
+def _newer_than_upload(path: str) -> bool:
+    """ Можно ли заменить скачанным PDF текущие замены """
+    if not _uploaded or not cache:
+        return True
+
+    with pdfplumber.open(path) as pdf:
+        header = read_header(pdf)
+
+    #  Без даты PDF всё равно не разберётся, пусть ошибка попадёт в `status`
+    if header is None:
+        return True
+
+    return overrides_date(header._asdict()) > overrides_date(next(iter(cache.values())))
+
+
+def _apply(path: str, digest: str, uploaded: bool):
+    """ Разбирает PDF и подменяет им замены, если это не тот же самый PDF """
+    global cache, teachers, _uploaded
+
+    if digest == status.sha256 and cache:
+        _uploaded = uploaded
+        return
+
+    new_cache = parse_overrides(path)
+
+    if not new_cache:
+        raise ValueError("В PDF не нашлось замен")
+
+    #  Запросы видят либо старые замены, либо новые целиком
+    cache, teachers = new_cache, TeacherOverrides(new_cache)
+    status.sha256 = digest
+    _uploaded = uploaded
+
+    _save_history(new_cache)
+
+
+def _save_history(new_cache: dict):
+    #  Без истории текущие замены всё равно должны отдаваться
+    try:
+        overrides_history.save(new_cache)
+    except Exception:
+        print("Не удалось сохранить историю замен", traceback.format_exc())
+
+
+def seconds_until_refresh(now: datetime) -> float:
+    """
+    Замены проверяются каждые `interval` минут,
+    а так же сразу после полуночи и после `publish_hour`, когда выкладывают новые.
+    """
+    publish = now.replace(hour=_settings().get("publish_hour", 15), minute=0, second=0, microsecond=0)
+
+    if now < publish:
+        boundary = publish
+    else:
+        boundary = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+    return min(_settings().get("interval", 5) * 60, (boundary - now).total_seconds())
+
+
+async def refresh_overrides():
+    """
+    Обновляет замены в отдельном потоке.
+
+    Если обновление уже идёт, ждёт его, а не запускает второе.
+    """
+    global _refreshing
+
+    if _refreshing is None:
+        _refreshing = asyncio.create_task(_locked(refresh))
+        _refreshing.add_done_callback(_refreshed)
+
+    await asyncio.shield(_refreshing)
+
+
+async def reparse_file(path: str):
+    """ Разбирает загруженный PDF в отдельном потоке, не мешая обновлению из сети """
+    await _locked(load_file, path)
+
+
+async def _locked(function, *args):
+    async with _lock:
+        await asyncio.to_thread(function, *args)
+
+
+def _refreshed(_task: asyncio.Task):
+    global _refreshing
+    _refreshing = None
+
+
+async def run_refresher():
+    while True:
+        await refresh_overrides()
+
+        delay = seconds_until_refresh(datetime.now())
+        status.next_check = time.time() + delay
+
+        await asyncio.sleep(max(delay, 1))
+
+
+@asynccontextmanager
+async def lifespan(_app):
+    """
+    Замены обновляются в фоне, пока работает сервер.
+
+    До первого скачивания загружается PDF, который загрузил админ,
+    иначе после перезапуска его замены пропали бы.
+    """
+    global _refresher
+
+    if os.path.isfile(UPLOADED):
+        try:
+            await reparse_file(UPLOADED)
+        except Exception:
+            print("Не удалось разобрать", UPLOADED, traceback.format_exc())
+
+    _refresher = asyncio.create_task(run_refresher())
+
+    yield
+
+    _refresher.cancel()
+
+
+async def download_overrides(group_id: str):
+    """
+    Замены группы из `cache`.
+
+    Сами замены скачивает `run_refresher`, запрос их не ждёт.
+    Только если замен ещё нет совсем, запрос ждёт обновления,
+    одного на все такие запросы.
+    """
+    if not cache and (
+            _refreshing is not None
+            or status.last_checked is None
+            or time.time() - status.last_checked > RETRY
+    ):
+        await refresh_overrides()
+
+    if not cache:
+        raise HTTPException(
+            status_code=HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Замены ещё не загружены"
+        )
 
     #  Берём первое попавшееся изменение,
     #  чтобы получить номер и день недели
@@ -46,4 +258,3 @@ def download_overrides(group_id: str):
         weekDay=c["weekDay"],
         weekNum = c["weekNum"]
     )
-
@@ -0,0 +1,110 @@
+import datetime
+import json
+from typing import Dict, List, Set
+
+from sqlalchemy import delete, select
+
+from ...database import Session
+from ...models.database import DatabaseOverride, DatabaseOverrideTeacher
+from .search import normalize
+from .teacher_overrides import TeacherOverrides, lesson_teachers
+
+
+def overrides_date(overrides: dict) -> datetime.date:
+    #  Месяц в заменах считается с нуля
+    return datetime.date(overrides["year"], overrides["month"] + 1, overrides["day"])
+
+
+def save(cache: Dict[str, dict]):
+    """
+    Сохраняет замены из `overrides_downloader.cache`.
+
+    Если замены на этот день уже сохранены, они заменяются новыми.
+    """
+    if not cache:
+        return
+
+    date = overrides_date(next(iter(cache.values())))
+
+    with Session.begin() as session:
+        session.execute(delete(DatabaseOverrideTeacher).where(DatabaseOverrideTeacher.date == date))
+        session.execute(delete(DatabaseOverride).where(DatabaseOverride.date == date))
+
+        position = 0
+
+        for group, overrides in cache.items():
+            for override in overrides["overrides"]:
+                row = DatabaseOverride(
+                    date=date,
+                    week_num=overrides["weekNum"],
+                    week_day=overrides["weekDay"],
+                    group=group,
+                    position=position,
+                    override=json.dumps(override, ensure_ascii=False)
+                )
+                session.add(row)
+                session.flush()
+
+                session.add_all(
+                    DatabaseOverrideTeacher(override_id=row.id, teacher=teacher, date=date)
+                    for teacher in _teachers(override)
+                )
+
+                position += 1
+
+
+def _teachers(override: dict) -> Set[str]:
+    """ Преподаватели замены после `normalize` """
+    return {
+        normalize(teacher)
+        for field in ("shouldBe", "willBe")
+        for teacher in lesson_teachers(override[field])
+    }
+
+
+def _caches(rows: List[DatabaseOverride]) -> Dict[datetime.date, Dict[str, dict]]:
+    """ Собирает строки обратно в вид `overrides_downloader.cache` по дням """
+    caches: Dict[datetime.date, Dict[str, dict]] = {}
+
+    for row in rows:
+        cache = caches.setdefault(row.date, {})
+
+        cache.setdefault(row.group, dict(
+            overrides=[],
+            weekDay=row.week_day,
+            weekNum=row.week_num,
+            day=row.date.day,
+            month=row.date.month - 1,
+            year=row.date.year
+        ))["overrides"].append(json.loads(row.override))
+
+    return caches
+
+
+def group_history(group: str, since: datetime.date, until: datetime.date) -> List[dict]:
+    """ Замены группы по дням с `since` по `until` включительно """
+    with Session.begin() as session:
+        rows = session.scalars(
+            select(DatabaseOverride)
+            .where(DatabaseOverride.group == group)
+            .where(DatabaseOverride.date.between(since, until))
+            .order_by(DatabaseOverride.date, DatabaseOverride.position)
+        ).all()
+
+        return [cache[group] for cache in _caches(rows).values()]
+
+
+def teacher_history(teacher: str, since: datetime.date, until: datetime.date) -> List[dict]:
+    """ Замены преподавателя по дням с `since` по `until` включительно """
+    with Session.begin() as session:
+        rows = session.scalars(
+            select(DatabaseOverride)
+            .join(DatabaseOverrideTeacher, DatabaseOverrideTeacher.override_id == DatabaseOverride.id)
+            .where(DatabaseOverrideTeacher.teacher == normalize(teacher))
+            .where(DatabaseOverrideTeacher.date.between(since, until))
+            .order_by(DatabaseOverride.date, DatabaseOverride.position)
+        ).all()
+
+        caches = _caches(rows)
+
+    return [TeacherOverrides(cache).get(teacher) for cache in caches.values()]
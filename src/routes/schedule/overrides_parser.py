@@ -1,8 +1,14 @@
+import concurrent.futures
+import os
 import re
 import traceback
-from typing import Dict
+from itertools import repeat
+from typing import Dict, List, NamedTuple, Optional
 import pdfplumber
+from parsers import pool_context
+from parsers.overrides_pages import extract_pages
 from . import downloader, overrides_downloader
+from ...utils import config
 
 weekdays = [
     "понедельник", "вторник", "среда", "четверг", "пятница", "суббота", "воскресенье"
@@ -107,91 +113,145 @@ def parse_cell_content(cell_text: str, room_str: str):
 
     return lessons
 
-def parse_overrides():
+
+def _workers_count() -> int:
+    #  Без forkserver (на Windows) разбираем в одном процессе
+    if pool_context() is None:
+        return 1
+
+    return config.get("overrides", {}).get("workers", 1) or os.cpu_count() or 1
+
+
+def extract_rows(path: str, pages: int, workers: int) -> List[list]:
+    """
+    Строки таблиц всех страниц по порядку.
+
+    При `workers` > 1 страницы делятся на куски подряд идущих страниц,
+    которые разбираются в отдельных процессах и склеиваются обратно по порядку,
+    поэтому группа, начатая на одной странице, продолжается на следующей как и раньше.
+    """
+    workers = min(workers, pages)
+    context = pool_context()
+
+    if workers <= 1 or context is None:
+        return extract_pages(path, 0, pages)
+
+    bounds = [pages * index // workers for index in range(workers + 1)]
+
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=context
+    ) as executor:
+        parts = executor.map(extract_pages, repeat(path), bounds[:-1], bounds[1:])
+
+        return [row for part in parts for row in part]
+
+
+class Header(NamedTuple):
+    """ Дата и неделя, на которые выложены замены, с первой страницы """
+    day: int
+    month: int
+    year: int
+    weeknum: int
+    weekday: int
+
+
+def read_header(pdf: pdfplumber.PDF) -> Optional[Header]:
+    try:
+        text = pdf.pages[0].extract_text()
+        if not text: return None
+        weeknum_line, weekday_line = text.split("\n")[:2]
+
+        day, month_str, year_str = weekday_line.split(" ")[:3]
+        day = int(day)
+        month = months.index(month_str.lower())
+        year = int(year_str[:4])
+
+        weeknum = int(weeknum_line.split(" ")[4]) - 1
+        weekday = weekdays.index(weekday_line.split(" ")[3].lower().replace("_", ""))
+    except Exception:
+        return None
+
+    return Header(day, month, year, weeknum, weekday)
+
+
+def build_overrides(rows: List[list], header: Header) -> Dict[str, dict]:
+    """ Замены по группам из строк таблиц, которые вернул `extract_rows` """
     current_group = None
     out: Dict[str, dict] = {}
 
-    with pdfplumber.open(f"{downloader.dir}zamena.pdf") as pdf:
-        rows = []
+    i = None
+
+    for row in rows[1:]:
         try:
-            text = pdf.pages[0].extract_text()
-            if not text: return {}
-            weeknum_line, weekday_line = text.split("\n")[:2]
-
-            day, month_str, year_str = weekday_line.split(" ")[:3]
-            day = int(day)
-            month = months.index(month_str.lower())
-            year = int(year_str[:4])
+            if not row or len(row) < 5: continue
+
+            if row[0] and current_group != row[0]:
+                current_group = row[0]
+
+            if current_group not in out:
+                out[current_group] = dict(
+                    overrides=[],
+                    weekDay=header.weekday,
+                    weekNum=header.weeknum,
+                    day=header.day,
+                    month=header.month,
+                    year=header.year
+                )
+
+            s_list = parse_cell_content(row[2], row[4])
+            w_list = parse_cell_content(row[3], row[4])
+
+            should_entry = None
+            if s_list:
+                if len(s_list) == 1:
+                     should_entry = { "commonLesson": s_list[0] }
+                else:
+                    should_entry = { 
+                        "subgroupedLesson": {
+                            "name": s_list[0]["name"],
+                            "subgroups": s_list 
+                        }
+                    }
+
+            will_entry = None
+            if w_list:
+                if len(w_list) == 1:
+                     will_entry = { "commonLesson": w_list[0] }
+                else:
+                    will_entry = { 
+                        "subgroupedLesson": {
+                            "name": w_list[0]["name"],
+                            "subgroups": w_list 
+                        }
+                    }
+
+            i = row[1] or i
             
-            weeknum = int(weeknum_line.split(" ")[4]) - 1
-            weekday = weekdays.index(weekday_line.split(" ")[3].lower().replace("_", ""))
+            out[current_group]["overrides"].append(dict(
+                shouldBe=should_entry,
+                willBe=will_entry,
+                index=int(i)-1 if i else 0
+            ))
         except Exception:
+            print(traceback.format_exc())
+
+    return out
+
+
+def parse_overrides(path: str = f"{downloader.dir}zamena.pdf", workers: Optional[int] = None):
+    with pdfplumber.open(path) as pdf:
+        header = read_header(pdf)
+        if header is None:
             return {}
 
-        for page in pdf.pages:
-            for table in page.extract_tables():
-                for row in table:
-                    rows.append(row)
-
-        i = None
-
-        for row in rows[1:]:
-            try:
-                if not row or len(row) < 5: continue
-                
-                if row[0] and current_group != row[0]: 
-                    current_group = row[0]
-
-                if current_group not in out:
-                    out[current_group] = dict(
-                        overrides=[],
-                        weekDay=weekday,
-                        weekNum=weeknum,
-                        day=day,
-                        month=month,
-                        year=year
-                    )
-
-                s_list = parse_cell_content(row[2], row[4])
-                w_list = parse_cell_content(row[3], row[4])
-
-                should_entry = None
-                if s_list:
-                    if len(s_list) == 1:
-                         should_entry = { "commonLesson": s_list[0] }
-                    else:
-                        should_entry = { 
-                            "subgroupedLesson": {
-                                "name": s_list[0]["name"],
-                                "subgroups": s_list 
-                            }
-                        }
+        rows = extract_rows(path, len(pdf.pages), _workers_count() if workers is None else workers)
 
-                will_entry = None
-                if w_list:
-                    if len(w_list) == 1:
-                         will_entry = { "commonLesson": w_list[0] }
-                    else:
-                        will_entry = { 
-                            "subgroupedLesson": {
-                                "name": w_list[0]["name"],
-                                "subgroups": w_list 
-                            }
-                        }
+    out = build_overrides(rows, header)
 
-                i = row[1] or i
-                
-                out[current_group]["overrides"].append(dict(
-                    shouldBe=should_entry,
-                    willBe=will_entry,
-                    index=int(i)-1 if i else 0
-                ))
-            except Exception:
-                print(traceback.format_exc())
-
-        if out:
-            print(out[list(out.keys())[0]])
-        return out
+    if out:
+        print(out[list(out.keys())[0]])
+    return out
 
 if __name__ == "__main__":
     overrides_downloader.download("Д-1-1")
@@ -0,0 +1,53 @@
+import asyncio
+import time
+import traceback
+from typing import Optional
+
+from ...models.api import RebuildStatus
+from . import schedule_parser
+
+status = RebuildStatus()
+""" Последняя запущенная пересборка """
+
+_lock = asyncio.Lock()
+_next: Optional[asyncio.Task] = None
+""" Пересборка, которая ждёт окончания текущей """
+
+
+async def _run():
+    global _next, status
+
+    async with _lock:
+        #  Для файлов, загруженных после этого момента, нужна уже следующая пересборка
+        _next = None
+        status = RebuildStatus(state="running", started_at=time.time())
+
+        try:
+            await asyncio.to_thread(schedule_parser.update, True, None, status)
+            status.state = "done"
+        except Exception:
+            status.state = "failed"
+            status.error = traceback.format_exc()
+            raise
+        finally:
+            status.stage = None
+            status.finished_at = time.time()
+
+
+async def rebuild_schedule():
+    """
+    Пересобирает расписание в отдельном потоке и ждёт, пока новое поколение станет текущим.
+
+    Если пересборка уже ждёт своей очереди, присоединяется к ней,
+    а не запускает ещё одну.
+    """
+    global _next
+
+    if _next is None:
+        _next = asyncio.create_task(_run())
+
+    await asyncio.shield(_next)
+
+
+def current_status() -> RebuildStatus:
+    return status.model_copy(update=dict(queued=_next is not None))
@@ -0,0 +1,95 @@
+import gzip
+import json
+from hashlib import sha256
+
+from fastapi import Request, Response, status
+
+
+def encode_json(content) -> bytes:
+    """ Кодирует JSON так же, как это делает `JSONResponse` в FastAPI """
+    return json.dumps(
+        content,
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":")
+    ).encode("utf-8")
+
+
+def _matches(if_none_match: str, etags) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        #  Слабое сравнение, как требует RFC 9110 для If-None-Match
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag in etags:
+            return True
+
+    return False
+
+
+def _etag(body: bytes) -> str:
+    return sha256(body).hexdigest()[:32]
+
+
+def respond_once(request: Request, body: bytes, media_type: str = "application/json") -> Response:
+    """
+    Ответ, который собирается на каждый запрос.
+
+    ETag и 304 работают как у `CachedResponse`, но без заранее сжатой версии.
+    """
+    etag = f'"{_etag(body)}"'
+    headers = {"ETag": etag}
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _matches(if_none_match, (etag,)):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    return Response(body, media_type=media_type, headers=headers)
+
+
+class CachedResponse:
+    """
+    Заранее закодированный ответ.
+
+    Хранит тело, его gzip версию и ETag,
+    чтобы не кодировать одно и то же на каждый запрос.
+    """
+
+    __slots__ = ("body", "gzipped", "etag", "gzip_etag", "media_type")
+
+    def __init__(self, body: bytes, media_type: str):
+        self.body = body
+        self.gzipped = gzip.compress(body, compresslevel=9, mtime=0)
+        self.media_type = media_type
+
+        digest = _etag(body)
+        self.etag = f'"{digest}"'
+        #  У разных кодировок одного ответа должны быть разные сильные ETag
+        self.gzip_etag = f'"{digest}-gzip"'
+
+    @classmethod
+    def from_json(cls, content) -> "CachedResponse":
+        return CachedResponse(encode_json(content), "application/json")
+
+    def respond(self, request: Request) -> Response:
+        use_gzip = "gzip" in request.headers.get("accept-encoding", "")
+        etag = self.gzip_etag if use_gzip else self.etag
+
+        headers = {
+            "ETag": etag,
+            "Vary": "Accept-Encoding"
+        }
+
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and _matches(if_none_match, (self.etag, self.gzip_etag)):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        if use_gzip:
+            headers["Content-Encoding"] = "gzip"
+            return Response(self.gzipped, media_type=self.media_type, headers=headers)
+
+        return Response(self.body, media_type=self.media_type, headers=headers)
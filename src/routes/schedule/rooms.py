@@ -0,0 +1,136 @@
+from typing import Dict, List, Optional, Set, Tuple
+
+Slot = Tuple[int, int, int]
+""" (неделя, день, номер пары) """
+
+
+def _lesson_rooms(entry: Optional[dict]) -> List[str]:
+    """ Кабинеты пары из замен """
+    if not entry:
+        return []
+
+    if entry.get("commonLesson"):
+        lessons = [entry["commonLesson"]]
+    else:
+        lessons = entry["subgroupedLesson"]["subgroups"]
+
+    #  Если в PDF кабинетов больше, чем пар, они остаются одной строкой через \n
+    return [
+        room.strip()
+        for lesson in lessons
+        for room in (lesson.get("room") or "").split("\n")
+        if room.strip()
+    ]
+
+
+class RoomOccupancy:
+    """
+    Занятость кабинетов битовыми масками.
+
+    На каждую пару - число, в котором бит i означает, что кабинет `rooms[i]` занят.
+    Свободные кабинеты - это оставшиеся биты, поэтому для ответа
+    не нужно обходить расписания групп.
+    """
+
+    def __init__(self, rooms: List[str], uses: List[Tuple[int, int, int, int, str]], bounds: Slot):
+        """
+        :param rooms: Кабинеты, по порядку битов
+        :param uses: (номер кабинета, неделя, день, номер пары, группа)
+        :param bounds: Сколько в расписании недель, дней в неделе и пар в дне
+        """
+        self.rooms = rooms
+        self.bounds = bounds
+        self.ids = {room: index for index, room in enumerate(rooms)}
+        self.uses = uses
+        self.all = (1 << len(rooms)) - 1
+
+        self.masks: Dict[Slot, int] = {}
+        for room, week, day, index, _ in uses:
+            self.masks[(week, day, index)] = self.masks.get((week, day, index), 0) | 1 << room
+
+        self._adjusted: Tuple[Optional[dict], Dict[Slot, int]] = (None, self.masks)
+
+    @classmethod
+    def from_room_schedules(cls, rooms: Dict[str, dict], bounds: Slot) -> "RoomOccupancy":
+        names = list(rooms)
+
+        return RoomOccupancy(names, [
+            (index, slot["weekNum"], slot["weekDay"], slot["index"], slot["group"])
+            for index, room in enumerate(names)
+            for slot in rooms[room]["slots"]
+        ], bounds)
+
+    def encode(self) -> dict:
+        return dict(rooms=self.rooms, uses=self.uses, bounds=self.bounds)
+
+    @classmethod
+    def decode(cls, data: dict) -> "RoomOccupancy":
+        return RoomOccupancy(data["rooms"], [tuple(use) for use in data["uses"]], tuple(data["bounds"]))
+
+    def contains(self, week: int, day: int, first: int, last: int) -> bool:
+        """ Есть ли в расписании пары с `first` по `last` этого дня """
+        weeks, days, lessons = self.bounds
+
+        return 0 <= week < weeks and 0 <= day < days and 0 <= first <= last < lessons
+
+    def _apply_overrides(self, overrides: Dict[str, dict]) -> Dict[Slot, int]:
+        """
+        Маски с учётом замен на их день.
+
+        Считается один раз на каждый новый `overrides_downloader.cache`.
+        """
+        if self._adjusted[0] is overrides:
+            return self._adjusted[1]
+
+        days = {(group["weekNum"], group["weekDay"]) for group in overrides.values()}
+
+        occupants: Dict[Slot, Set[Tuple[int, str]]] = {}
+        for room, week, day, index, group in self.uses:
+            if (week, day) in days:
+                occupants.setdefault((week, day, index), set()).add((room, group))
+
+        for group_name, group in overrides.items():
+            for override in group["overrides"]:
+                slot = (group["weekNum"], group["weekDay"], override["index"])
+
+                #  В PDF кабинет только один, и в shouldBe он тот же, что в willBe,
+                #  поэтому группа освобождает все кабинеты, которые занимала по расписанию
+                slot_occupants = {
+                    (room, name)
+                    for room, name in occupants.get(slot, ())
+                    if name != group_name
+                }
+                occupants[slot] = slot_occupants
+
+                for room in _lesson_rooms(override["willBe"]):
+                    if room in self.ids:
+                        slot_occupants.add((self.ids[room], group_name))
+
+        masks = {
+            slot: mask
+            for slot, mask in self.masks.items()
+            if slot[:2] not in days
+        }
+
+        for slot, slot_occupants in occupants.items():
+            for room, _ in slot_occupants:
+                masks[slot] = masks.get(slot, 0) | 1 << room
+
+        self._adjusted = (overrides, masks)
+        return masks
+
+    def free(self, week: int, day: int, first: int, last: int, overrides: Optional[Dict[str, dict]] = None) -> List[str]:
+        """ Кабинеты, свободные на всех парах с `first` по `last` включительно """
+        masks = self._apply_overrides(overrides) if overrides else self.masks
+
+        occupied = 0
+        for index in range(first, last + 1):
+            occupied |= masks.get((week, day, index), 0)
+
+        free = self.all & ~occupied
+
+        return [
+            room
+            for index, room in enumerate(self.rooms)
+            if free >> index & 1
+        ]
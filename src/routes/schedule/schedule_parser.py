@@ -1,180 +1,337 @@
 import os
 import json
+import time
 import zipfile
-from typing import Dict, List
+from contextlib import contextmanager
+from itertools import repeat
+from typing import Dict, List, Mapping, Optional, Tuple
 
 import alive_progress
-from bs4 import BeautifulSoup
 import concurrent.futures
 
+from parsers import pool_context
+from parsers.schedule_page import ParseResult, parse_member
+from ...models.api import RebuildStatus
+from ...utils import config
+from .rooms import RoomOccupancy
+from .schedule_store import CompactSchedule, ScheduleShards, write_atomic
+
 _archive = zipfile.ZipFile('database/fixed_files/schedule.zip', 'r')
-_namelist = _archive.namelist()
 
 
-cache: Dict[str, dict] = {}
-filenames: Dict[str, str] = {}
-items: Dict[str, List[str]] = {
-    "groups": [],
-    "teachers": []
-}
+cache: Optional[ScheduleShards] = None
+"""
+Текущее поколение расписания, загружается в `update()`.
 
-if os.path.isfile("items.json"):
-    items = json.load(open("items.json"))
+Списки групп и преподавателей - `cache.item_lists`,
+файлы в архиве - `cache.filenames`.
+Пересборка подменяет его целиком одним присваиванием.
+"""
 
-if os.path.isfile("schedule.json"):
-    cache = json.load(open("schedule.json"))
 
+_checked = 0.0
+""" Когда `reload_if_changed` последний раз смотрел на index.json (time.monotonic) """
 
-TEACHER = 0
-STUDENT = 1
+CHECK_INTERVAL = 1
+""" Не чаще скольких секунд проверять, не записал ли другой воркер новое поколение """
 
-def get_html(target):
-    if not target in filenames: return None
 
-    return _archive.read(filenames[target]).decode("windows-1251").replace("windows-1251", "utf-8")
+SHARDS = "database/schedule"
+""" Расписание по файлу на группу или преподавателя, см. `ScheduleShards` """
 
-def process_file(file):
-    if not file.endswith(".html"):
-        return
-        
-    schedule = dict(weeks=[])
+MANIFEST = "manifest.json"
+""" Контрольные суммы файлов архива и что из них получилось """
+
+def render_html(data: bytes) -> bytes:
+    """ Перекодирует страницу из архива в UTF-8 """
+    return data.decode("windows-1251").replace("windows-1251", "utf-8").encode("utf-8")
+
+
+def render_pages(archive: zipfile.ZipFile, filenames: Dict[str, str]) -> Dict[str, bytes]:
+    return {
+        target: render_html(archive.read(file))
+        for target, file in filenames.items()
+    }
+
+
+def _engine() -> str:
+    return config.get("schedule", {}).get("parser", "stream")
 
-    soup = BeautifulSoup(_archive.read(file).decode("windows-1251"), 'html.parser')
 
-    target = soup.find('font', {'face': 'Times New Roman', 'size': '6', 'color': '#ff00ff'}).children.__next__().text.strip()
+def _parse_member(data: bytes):
+    return parse_member(data, _engine())
 
-    if target.lower() in [".", "вакансия"]:
+
+def merge_file(
+        file: str,
+        parsed: ParseResult,
+        schedules: CompactSchedule,
+        items: Dict[str, List[str]],
+        filenames: Dict[str, str]
+):
+    """ Добавляет результат `parse_page` в расписания, `items` и `filenames` """
+    if parsed is None:
         return
 
+    target, target_type, schedule = parsed
+
     print(target, "." in target, "-" in target)
 
-    if "." in target:
-        if target in items["teachers"]:
-            return
+    match target_type:
+        case 0:
+            if target in items["teachers"]:
+                return
 
-        items["teachers"].append(target)
-        target_type = TEACHER
+            items["teachers"].append(target)
+        case 1:
+            if target in items["groups"]:
+                return
 
-    elif "-" in target:
-        if target in items["groups"]:
+            items["groups"].append(target)
+        case _:
             return
 
-        items["groups"].append(target)
-        target_type = STUDENT
-    else:
-        return
-
     filenames[target] = file
+    schedules[target] = schedule
+
+
+def process_file(file, archive: Optional[zipfile.ZipFile] = None) -> ParseResult:
+    if not file.endswith(".html"):
+        return None
+
+    return _parse_member((archive or _archive).read(file))
+
+
+def _workers_count() -> int:
+    #  Без forkserver (на Windows) парсим в одном процессе
+    if pool_context() is None:
+        return 1
+
+    return config.get("schedule", {}).get("workers") or os.cpu_count() or 1
+
+
+def parse_members(
+        files: List[str],
+        workers: int,
+        archive: Optional[zipfile.ZipFile] = None,
+        status: Optional[RebuildStatus] = None
+) -> Dict[str, ParseResult]:
+    """
+    Парсит страницы архива, при `workers` > 1 - в нескольких процессах.
+
+    :return: Имя файла в архиве: результат `parse_page`
+    """
+    archive = archive or _archive
+    status = status or RebuildStatus()
+    out: Dict[str, ParseResult] = {}
 
-    for table in soup.find_all("table"):
-        week = dict(days=[])
-
-        #  Первые две строки таблицы - это номера пар и время
-        for row_index, row in enumerate(table.find_all("tr")[2:]):
-            day = dict(lessons=[])
-
-            #  Первая ячейка - это день недели
-            for cell_index, cell in enumerate(row.find_all("td")[1:]):
-                childs = list(cell.find("font").find("p").stripped_strings)
-                text = [text.strip() for text in childs if text.strip()]
-
-                if not text or text[0] in "-_":
-                    day["lessons"].append(None)
-                    continue
-
-                match target_type:
-                    case 0:
-                        match len(text):
-                            case 3:
-                                group, name, room = text
-                            case 2:
-                                group_and_name, room = text
-
-                                group = ""
-                                num = False
-
-                                for i in group_and_name:
-                                    if i == '-' or i.isdigit():
-                                        num = True
-                                    if num and not (i == '-' or i.isdigit()):
-                                        break
-                                    group += i
-
-                                name = group_and_name[len(group):]
-
-                        day["lessons"].append(dict(
-                            group=group,
-                            commonLesson=dict(
-                                name=name,
-                                room=room,
-                                teacher=target
-                            )
-                        ))
-                    case 1:
-                        if len(text) == 2:
-                            name = text[0]
-                            teacher, room = text[1].rsplit(" ", 1)
-
-                            lesson = dict(
-                                commonLesson=dict(
-                                    name=name,
-                                    teacher=teacher,
-                                    room=room
-                                ),
-                                group=target
-                            )
-                        elif len(text) == 3:
-                            name = text[0]
-                            subgroups = [
-                                dict(
-                                    teacher=string[6:].rsplit(" ", 1)[0],
-                                    room=string[6:].rsplit(" ", 1)[1],
-                                    subgroup_index=index+1
-                                )
-                                for index, string in enumerate(text[1:])
-                            ]
-                            """
-                            [
-                                'Иностранный язык', 
-                                '1 п/г Предеина Е.И. 201', 
-                                '2 п/г Акиева Н.В. 236'
-                            ]
-                            """
-
-                            lesson = dict(
-                                subgroupedLesson=dict(
-                                    name=name,
-                                    subgroups=subgroups
-                                ),
-                                group=target
-                            )
-                        day["lessons"].append(lesson)
-
-            week["days"].append(day)
-
-        schedule["weeks"].append(week)
-
-    cache[target] = schedule
-
-
-def update(force: bool = False):
-    global items, cache, filenames
-    
-    if force or not all([os.path.exists(file) for file in ("items.json", "schedule.json", "filenames.json")]):
-        with alive_progress.alive_bar(len(_namelist)) as bar:
-            for file in _namelist:
-                process_file(file)
+    status.done, status.total = 0, len(files)
+    context = pool_context()
+
+    with alive_progress.alive_bar(len(files)) as bar:
+        if workers <= 1 or context is None:
+            for file in files:
+                out[file] = process_file(file, archive)
+                status.done += 1
+                bar()
+            return out
+
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=context
+        ) as executor:
+            results = executor.map(
+                parse_member,
+                (archive.read(file) for file in files),
+                repeat(_engine()),
+                chunksize=8
+            )
+
+            for file, parsed in zip(files, results):
+                out[file] = parsed
+                status.done += 1
                 bar()
 
+    return out
+
+
+def _reuse(entry: dict, old_cache: Mapping[str, dict]) -> ParseResult:
+    """ Достаёт из старых данных результат парсинга файла, который не поменялся """
+    target = entry["target"]
+
+    if target is None:
+        return None
+
+    if entry["type"] is None:
+        return target, None, None
+
+    return target, entry["type"], old_cache[target]
+
+
+@contextmanager
+def _stage(status: RebuildStatus, name: str):
+    status.stage = name
+    start = time.perf_counter()
+
+    yield
+
+    status.timings[name] = round(time.perf_counter() - start, 3)
+
+
+def rebuild(workers: int, status: Optional[RebuildStatus] = None) -> Tuple[zipfile.ZipFile, ScheduleShards]:
+    """
+    Парсит schedule.zip в новое поколение, текущее не трогает.
+
+    Заново разбираются только те файлы архива,
+    у которых по `MANIFEST` поменялась контрольная сумма.
+
+    :return: Новый архив и новое поколение расписания
+    """
+    status = status or RebuildStatus()
+
+    with _stage(status, "scan"):
+        #  После загрузки нового schedule.zip старый список файлов не актуален
+        archive = zipfile.ZipFile('database/fixed_files/schedule.zip', 'r')
+
+        manifest = {}
+        if os.path.isfile(MANIFEST):
+            manifest = json.load(open(MANIFEST))
+
+        #  С диска, а не из `cache`: поколение мог записать другой воркер, и манифест уже от него
+        previous = _open_shards() if ScheduleShards.exists(SHARDS) else None
+        old_cache, old_filenames = previous or {}, previous.filenames if previous else {}
+
+        reused: Dict[str, ParseResult] = {}
+        changed: List[str] = []
+
+        for info in archive.infolist():
+            if not info.filename.endswith(".html"):
+                continue
+
+            entry = manifest.get(info.filename)
+
+            if (
+                    entry is not None
+                    and entry["crc"] == info.CRC
+                    and entry["size"] == info.file_size
+                    #  Страница, которая дублировала другую, не попала в кэш
+                    and (entry["type"] is None or old_filenames.get(entry["target"]) == info.filename)
+            ):
+                reused[info.filename] = _reuse(entry, old_cache)
+            else:
+                changed.append(info.filename)
+
+    print(f"Изменилось файлов расписания: {len(changed)} из {len(changed) + len(reused)}")
+
+    with _stage(status, "parse"):
+        parsed = parse_members(changed, workers, archive, status)
+        parsed.update(reused)
+
+    with _stage(status, "merge"):
+        new_cache, new_filenames = CompactSchedule(), {}
+        new_items = {
+            "groups": [],
+            "teachers": []
+        }
+
+        for file in archive.namelist():
+            if file in parsed:
+                merge_file(file, parsed[file], new_cache, new_items, new_filenames)
+
+        new_items["teachers"].sort()
+        new_items["groups"].sort()
+
+        manifest = {
+            info.filename: dict(
+                crc=info.CRC,
+                size=info.file_size,
+                target=parsed[info.filename][0] if parsed[info.filename] else None,
+                type=parsed[info.filename][1] if parsed[info.filename] else None
+            )
+            for info in archive.infolist()
+            if info.filename in parsed
+        }
+
+    with _stage(status, "write"):
+        with open("filenames.json", "w") as f: json.dump(new_filenames, f)
+        with open("schedule.json", "w") as f: json.dump(dict(new_cache), f)
+        with open("items.json", "w") as f: json.dump(new_items, f)
+
+        rooms = new_cache.room_schedules(new_items["groups"])
+
+        ScheduleShards.write(
+            SHARDS,
+            new_cache,
+            new_items,
+            new_filenames,
+            render_pages(archive, new_filenames),
+            rooms,
+            RoomOccupancy.from_room_schedules(rooms, new_cache.bounds())
+        )
+
+        #  Последним: если расписание не записалось, следующая пересборка разберёт файлы заново
+        write_atomic(MANIFEST, json.dumps(manifest).encode())
+
+    return archive, _open_shards()
+
+
+def _open_shards() -> ScheduleShards:
+    return ScheduleShards(SHARDS, config.get("schedule", {}).get("loaded_items", 64))
+
+
+def reload_if_changed():
+    """
+    Подхватывает поколение, которое записал другой воркер.
+
+    Текущий `cache` не меняется, вместо него открывается новый,
+    поэтому в нём не остаётся ничего от старого поколения.
+    """
+    global cache, _checked
+
+    now = time.monotonic()
+    if cache is None or now - _checked < CHECK_INTERVAL:
+        return
+
+    _checked = now
+
+    if cache.changed():
+        cache = _open_shards()
+
+
+def update(force: bool = False, workers: Optional[int] = None, status: Optional[RebuildStatus] = None):
+    """
+    Загружает индекс расписания, при необходимости пересобирая его.
 
-        items["teachers"].sort()
-        items["groups"].sort()
+    Сами расписания читаются из `SHARDS` по мере надобности.
+    Может выполняться в отдельном потоке: до самой подмены `cache`
+    запросы обслуживаются старым поколением.
+    """
+    global cache, _archive
 
+    legacy = ("items.json", "schedule.json", "filenames.json")
 
-        with open("filenames.json", "w") as f: json.dump(filenames, f)
-        with open("schedule.json", "w") as f: json.dump(cache, f)
-        with open("items.json", "w") as f: json.dump(items, f)
+    if force or not all([os.path.exists(file) for file in legacy]):
+        archive, shards = rebuild(_workers_count() if workers is None else workers, status)
     else:
-        items = json.load(open("items.json"))
-        cache = json.load(open("schedule.json"))
-        filenames = json.load(open("filenames.json"))
+        if not ScheduleShards.exists(SHARDS):
+            #  Расписание уже разобрано, но ещё не разложено по файлам
+            schedules = CompactSchedule.from_dict(json.load(open("schedule.json")))
+            items = json.load(open("items.json"))
+            filenames = json.load(open("filenames.json"))
+            rooms = schedules.room_schedules(items["groups"])
+
+            ScheduleShards.write(
+                SHARDS,
+                schedules,
+                items,
+                filenames,
+                render_pages(_archive, filenames),
+                rooms,
+                RoomOccupancy.from_room_schedules(rooms, schedules.bounds())
+            )
+
+        archive, shards = _archive, _open_shards()
+
+    #  Страницы тоже лежат в `cache`, архив нужен только для `process_file`
+    _archive = archive
+    cache = shards
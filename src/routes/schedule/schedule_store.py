@@ -0,0 +1,542 @@
+import functools
+import json
+import os
+import tempfile
+from collections.abc import Mapping, MutableMapping
+from hashlib import sha256
+from typing import Dict, List, NamedTuple, Optional, Tuple, Iterator
+
+from parsers.schedule_page import TEACHER, STUDENT
+from .response_cache import CachedResponse, encode_json
+from .rooms import RoomOccupancy
+from .search import ItemSearch
+
+
+class StringTable:
+    """ Таблица строк: каждая строка хранится один раз, а в уроках лежит её номер """
+
+    __slots__ = ("strings", "ids")
+
+    def __init__(self):
+        self.strings: List[str] = []
+        self.ids: Dict[str, int] = {}
+
+    def add(self, string: str) -> int:
+        index = self.ids.get(string)
+
+        if index is None:
+            index = self.ids[string] = len(self.strings)
+            self.strings.append(string)
+
+        return index
+
+    def __getitem__(self, index: int) -> str:
+        return self.strings[index]
+
+    def __len__(self):
+        return len(self.strings)
+
+
+class CommonLesson(NamedTuple):
+    group: int
+    name: int
+    teacher: int
+    room: int
+
+
+class Subgroup(NamedTuple):
+    teacher: int
+    room: int
+    subgroup_index: int
+
+
+class SubgroupedLesson(NamedTuple):
+    group: int
+    name: int
+    subgroups: Tuple[Subgroup, ...]
+
+
+Lesson = Optional[CommonLesson | SubgroupedLesson]
+
+Weeks = Tuple[Tuple[Tuple[Lesson, ...], ...], ...]
+""" Недели -> дни -> пары """
+
+
+class CompactSchedule(MutableMapping):
+    """
+    Расписание всех групп и преподавателей в сжатом виде.
+
+    Названия предметов, преподаватели, кабинеты и группы лежат в таблицах строк,
+    одинаковые пары и дни - в одном экземпляре.
+    Снаружи выглядит как словарь `цель: расписание` в формате schedule.json,
+    расписание собирается из таблиц при каждом обращении.
+    """
+
+    def __init__(self):
+        self.subjects = StringTable()
+        self.teachers = StringTable()
+        self.rooms = StringTable()
+        self.groups = StringTable()
+
+        self._items: Dict[str, Weeks] = {}
+        self._interned: Dict[tuple, tuple] = {}
+
+    @classmethod
+    def from_dict(cls, schedules: Dict[str, dict]) -> "CompactSchedule":
+        store = CompactSchedule()
+
+        for target, schedule in schedules.items():
+            store[target] = schedule
+
+        return store
+
+    def _intern(self, value):
+        #  Тип в ключе, чтобы NamedTuple не совпал с обычным tuple из тех же чисел
+        return self._interned.setdefault((type(value), value), value)
+
+    def _compact_lesson(self, lesson: Optional[dict]) -> Lesson:
+        if lesson is None:
+            return None
+
+        group = self.groups.add(lesson["group"])
+
+        if "commonLesson" in lesson:
+            common = lesson["commonLesson"]
+
+            return self._intern(CommonLesson(
+                group=group,
+                name=self.subjects.add(common["name"]),
+                teacher=self.teachers.add(common["teacher"]),
+                room=self.rooms.add(common["room"])
+            ))
+
+        subgrouped = lesson["subgroupedLesson"]
+
+        return self._intern(SubgroupedLesson(
+            group=group,
+            name=self.subjects.add(subgrouped["name"]),
+            subgroups=self._intern(tuple(
+                self._intern(Subgroup(
+                    teacher=self.teachers.add(subgroup["teacher"]),
+                    room=self.rooms.add(subgroup["room"]),
+                    subgroup_index=subgroup["subgroup_index"]
+                ))
+                for subgroup in subgrouped["subgroups"]
+            ))
+        ))
+
+    def _encode_lesson(self, lesson: Lesson, target_type: int) -> Optional[dict]:
+        if lesson is None:
+            return None
+
+        #  Порядок ключей как у парсера, чтобы schedule.json не менялся
+        if isinstance(lesson, CommonLesson):
+            name = self.subjects[lesson.name]
+            teacher = self.teachers[lesson.teacher]
+            room = self.rooms[lesson.room]
+
+            if target_type == TEACHER:
+                return dict(
+                    group=self.groups[lesson.group],
+                    commonLesson=dict(name=name, room=room, teacher=teacher)
+                )
+
+            return dict(
+                commonLesson=dict(name=name, teacher=teacher, room=room),
+                group=self.groups[lesson.group]
+            )
+
+        return dict(
+            subgroupedLesson=dict(
+                name=self.subjects[lesson.name],
+                subgroups=[
+                    dict(
+                        teacher=self.teachers[subgroup.teacher],
+                        room=self.rooms[subgroup.room],
+                        subgroup_index=subgroup.subgroup_index
+                    )
+                    for subgroup in lesson.subgroups
+                ]
+            ),
+            group=self.groups[lesson.group]
+        )
+
+    def room_schedules(self, groups: List[str]) -> Dict[str, dict]:
+        """
+        Кто и когда занимает каждый кабинет, по расписаниям групп.
+
+        :return: Кабинет: {"slots": [{weekNum, weekDay, index, group, name, teacher, subgroup_index}]}
+        """
+        rooms: Dict[int, list] = {}
+
+        for group in groups:
+            for week_num, week in enumerate(self._items[group]):
+                for week_day, day in enumerate(week):
+                    for index, lesson in enumerate(day):
+                        if lesson is None:
+                            continue
+
+                        if isinstance(lesson, CommonLesson):
+                            uses = [(lesson.room, lesson.teacher, None)]
+                        else:
+                            uses = [
+                                (subgroup.room, subgroup.teacher, subgroup.subgroup_index)
+                                for subgroup in lesson.subgroups
+                            ]
+
+                        for room, teacher, subgroup_index in uses:
+                            rooms.setdefault(room, []).append(dict(
+                                weekNum=week_num,
+                                weekDay=week_day,
+                                index=index,
+                                group=self.groups[lesson.group],
+                                name=self.subjects[lesson.name],
+                                teacher=self.teachers[teacher],
+                                subgroup_index=subgroup_index
+                            ))
+
+        return {
+            self.rooms[room]: dict(slots=sorted(
+                slots,
+                key=lambda slot: (slot["weekNum"], slot["weekDay"], slot["index"], slot["group"])
+            ))
+            for room, slots in sorted(rooms.items(), key=lambda pair: self.rooms[pair[0]])
+        }
+
+    def bounds(self) -> Tuple[int, int, int]:
+        """ Больше всего недель, дней в неделе и пар в дне среди всех расписаний """
+        weeks = list(self._items.values())
+
+        return (
+            max(map(len, weeks), default=0),
+            max((len(week) for item in weeks for week in item), default=0),
+            max((len(day) for item in weeks for week in item for day in week), default=0)
+        )
+
+    def weeks(self, target: str) -> Weeks:
+        """ Расписание в сжатом виде, без сборки словарей """
+        return self._items[target]
+
+    def __setitem__(self, target: str, schedule: dict):
+        self._items[target] = self._intern(tuple(
+            self._intern(tuple(
+                self._intern(tuple(
+                    self._compact_lesson(lesson)
+                    for lesson in day["lessons"]
+                ))
+                for day in week["days"]
+            ))
+            for week in schedule["weeks"]
+        ))
+
+    def __getitem__(self, target: str) -> dict:
+        target_type = TEACHER if "." in target else STUDENT
+
+        return dict(weeks=[
+            dict(days=[
+                dict(lessons=[
+                    self._encode_lesson(lesson, target_type)
+                    for lesson in day
+                ])
+                for day in week
+            ])
+            for week in self._items[target]
+        ])
+
+    def __delitem__(self, target: str):
+        del self._items[target]
+
+    def __contains__(self, target) -> bool:
+        return target in self._items
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._items)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+def write_atomic(path: str, data: bytes):
+    """ Пишет файл во временный рядом и подменяет, чтобы читатели не увидели его наполовину """
+    directory = os.path.dirname(path) or "."
+
+    with tempfile.NamedTemporaryFile("wb", dir=directory, delete=False) as f:
+        f.write(data)
+
+    os.replace(f.name, path)
+
+
+def _changed_days(old: dict, new: dict) -> Optional[List[dict]]:
+    """
+    Дни `new`, которые отличаются от `old`: {"weekNum", "weekDay", "lessons"}.
+
+    None, если у расписаний разное число недель или дней.
+    """
+    if [len(week["days"]) for week in old["weeks"]] != [len(week["days"]) for week in new["weeks"]]:
+        return None
+
+    return [
+        dict(weekNum=week_index, weekDay=day_index, **new_day)
+        for week_index, (old_week, new_week) in enumerate(zip(old["weeks"], new["weeks"]))
+        for day_index, (old_day, new_day) in enumerate(zip(old_week["days"], new_week["days"]))
+        if old_day != new_day
+    ]
+
+
+class ScheduleShards(Mapping):
+    """
+    Расписание, разложенное по файлам.
+
+    В `directory` лежит index.json со списками групп и преподавателей,
+    по json файлу на каждую цель и её HTML страница в UTF-8,
+    а так же по json файлу на каждый кабинет и общая занятость кабинетов.
+    Файлы называются по sha256 содержимого,
+    поэтому новое поколение не перезаписывает файлы старого.
+    Файлы читаются с диска при первом обращении,
+    в памяти держатся последние `max_loaded` из них.
+    """
+
+    VERSION = 6
+    """ Меняется вместе с форматом index.json и файлов из него, старый индекс пересобирается """
+
+    KINDS = dict(
+        shards=("json", "application/json"),
+        pages=("html", "text/html; charset=utf-8"),
+        rooms=("json", "application/json"),
+        occupancy=("json", "application/json")
+    )
+    """ Раздел индекса: (расширение файлов, MIME тип) """
+
+    HISTORY = 8
+    """ Сколько прошлых поколений помнит индекс, см. `changes` """
+
+    def __init__(self, directory: str, max_loaded: int):
+        self.directory = directory
+        self._load_index()
+        self._loaded = functools.lru_cache(max_loaded)(self._load)
+
+    def _load_index(self):
+        #  stat до чтения: если индекс перепишут прямо сейчас, `changed` это заметит
+        self._index_version = self._stat_index()
+        index = json.load(open(f"{self.directory}/index.json"))
+
+        self.item_lists: Dict[str, List[str]] = index["items"]
+        self.filenames: Dict[str, str] = index["filenames"]
+        self.shards: Dict[str, str] = index["shards"]
+        self.pages: Dict[str, str] = index["pages"]
+        self.rooms: Dict[str, str] = index["rooms"]
+        #  Один файл на поколение, но так его можно читать как остальные
+        self.occupancy_file: Dict[str, str] = index["occupancy"]
+        self.generation: int = index["generation"]
+        #  Поколение: хэши расписаний в нём
+        self.history: Dict[int, Dict[str, str]] = {
+            int(generation): shards
+            for generation, shards in index["history"].items()
+        }
+
+        self.room_list = CachedResponse.from_json(list(self.rooms))
+        self.search = ItemSearch(self.item_lists)
+        self.changes_response = functools.lru_cache(self.HISTORY + 1)(self._changes_response)
+
+    def _stat_index(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(f"{self.directory}/index.json")
+        except FileNotFoundError:
+            return None
+
+        return stat.st_ino, stat.st_mtime_ns
+
+    def changed(self) -> bool:
+        """ Записал ли кто-то (например другой воркер) новый index.json после того, как мы его прочитали """
+        return self._stat_index() != self._index_version
+
+    @classmethod
+    def exists(cls, directory: str) -> bool:
+        if not os.path.isfile(f"{directory}/index.json"):
+            return False
+
+        return json.load(open(f"{directory}/index.json")).get("version") == cls.VERSION
+
+    @classmethod
+    def _write_content(cls, directory: str, data: bytes, extension: str) -> str:
+        name = sha256(data).hexdigest()
+
+        if not os.path.isfile(f"{directory}/{name}.{extension}"):
+            write_atomic(f"{directory}/{name}.{extension}", data)
+
+        return name
+
+    @classmethod
+    def write(
+            cls,
+            directory: str,
+            schedules: Mapping,
+            items: Dict[str, List[str]],
+            filenames: Dict[str, str],
+            pages: Mapping[str, bytes],
+            rooms: Mapping[str, dict],
+            occupancy: RoomOccupancy
+    ):
+        """
+        Записывает новое поколение и удаляет файлы, которые не нужны ни ему, ни прошлому.
+
+        Файлы, содержимое которых не поменялось, остаются как есть.
+        Если поменялось хоть одно расписание, номер поколения увеличивается,
+        а расписания прошлых `HISTORY` поколений остаются на диске для `changes`.
+        """
+        os.makedirs(directory, exist_ok=True)
+
+        previous = {}
+        if os.path.isfile(f"{directory}/index.json"):
+            previous = json.load(open(f"{directory}/index.json"))
+
+        shards = {
+            target: cls._write_content(directory, encode_json(schedules[target]), "json")
+            for target in schedules
+        }
+
+        generation = previous.get("generation", 0)
+        history = previous.get("history", {})
+
+        if shards != previous.get("shards"):
+            if "generation" in previous:
+                history[str(generation)] = previous["shards"]
+
+            generation += 1
+
+        history = {
+            key: history[key]
+            for key in sorted(history, key=int)[-cls.HISTORY:]
+        }
+
+        index = dict(
+            version=cls.VERSION,
+            generation=generation,
+            history=history,
+            items=items,
+            filenames=filenames,
+            shards=shards,
+            pages={
+                target: cls._write_content(directory, pages[target], "html")
+                for target in pages
+            },
+            rooms={
+                room: cls._write_content(directory, encode_json(rooms[room]), "json")
+                for room in rooms
+            },
+            occupancy=dict(
+                all=cls._write_content(directory, encode_json(occupancy.encode()), "json")
+            )
+        )
+
+        write_atomic(f"{directory}/index.json", json.dumps(index).encode())
+
+        #  Файлы прошлого поколения оставляем для воркеров, которые ещё не перечитали индекс
+        keep = {"index.json"}
+        for generation in (index, previous):
+            for kind, (extension, _) in cls.KINDS.items():
+                keep.update(f"{name}.{extension}" for name in generation.get(kind, {}).values())
+
+        for old_shards in history.values():
+            keep.update(f"{name}.json" for name in old_shards.values())
+
+        for file in os.listdir(directory):
+            if file not in keep and file.endswith((".json", ".html")):
+                os.remove(f"{directory}/{file}")
+
+    def _names(self, kind: str) -> Dict[str, str]:
+        return self.occupancy_file if kind == "occupancy" else getattr(self, kind)
+
+    def _path(self, kind: str, name: str) -> str:
+        extension, _ = self.KINDS[kind]
+        return f"{self.directory}/{self._names(kind)[name]}.{extension}"
+
+    def _read(self, kind: str, name: str) -> bytes:
+        return open(self._path(kind, name), "rb").read()
+
+    def _load(self, kind: str, name: str) -> CachedResponse:
+        _, media_type = self.KINDS[kind]
+        return CachedResponse(self._read(kind, name), media_type)
+
+    def _get(self, kind: str, name: str) -> Optional[CachedResponse]:
+        if name not in self._names(kind):
+            return None
+
+        return self._loaded(kind, name)
+
+    def response(self, target: str) -> Optional[CachedResponse]:
+        return self._get("shards", target)
+
+    def page(self, target: str) -> Optional[CachedResponse]:
+        """ HTML страница расписания из schedule.zip, перекодированная в UTF-8 """
+        return self._get("pages", target)
+
+    def room(self, room: str) -> Optional[CachedResponse]:
+        """ Занятия в кабинете, см. `CompactSchedule.room_schedules` """
+        return self._get("rooms", room)
+
+    @functools.cached_property
+    def occupancy(self) -> RoomOccupancy:
+        """ Читается при первом поиске свободных кабинетов """
+        return RoomOccupancy.decode(json.loads(self._read("occupancy", "all")))
+
+    def changes(self, since: int) -> dict:
+        """
+        Что поменялось в расписаниях после поколения `since`.
+
+        Если поменялись только некоторые дни, в "days" попадут только они,
+        целиком отдаются новые расписания и те, у которых поменялось число недель или дней.
+        Если `since` слишком старое, "full" будет true и клиенту нужно скачать всё заново.
+        """
+        changes = dict(generation=self.generation, full=False, removed=[], items={}, days={})
+
+        if since == self.generation:
+            return changes
+
+        if since not in self.history:
+            changes["full"] = True
+            return changes
+
+        old_shards = self.history[since]
+
+        changes["removed"] = sorted(set(old_shards) - set(self.shards))
+
+        for target, name in self.shards.items():
+            if old_shards.get(target) == name:
+                continue
+
+            new = self[target]
+            days = None
+
+            if target in old_shards:
+                try:
+                    old = json.load(open(f"{self.directory}/{old_shards[target]}.json"))
+                    days = _changed_days(old, new)
+                except FileNotFoundError:
+                    #  Поколение уже удалил другой воркер, отдаём расписание целиком
+                    pass
+
+            if days is None:
+                changes["items"][target] = new
+            else:
+                changes["days"][target] = days
+
+        return changes
+
+    def _changes_response(self, since: int) -> CachedResponse:
+        return CachedResponse.from_json(self.changes(since))
+
+    def __getitem__(self, target: str) -> dict:
+        if target not in self.shards:
+            raise KeyError(target)
+
+        return json.loads(self.response(target).body)
+
+    def __contains__(self, target) -> bool:
+        return target in self.shards
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.shards)
+
+    def __len__(self) -> int:
+        return len(self.shards)
@@ -0,0 +1,135 @@
+import bisect
+import re
+from typing import Dict, List, Set, Tuple
+
+MIN_FUZZY_LENGTH = 3
+""" Опечатки в фамилии ищутся, только если введено хотя бы столько букв """
+
+
+def normalize(text: str) -> str:
+    """
+    Регистр, ё, дефисы, точки и пробелы не важны.
+    Фамилия отделяется от инициалов одним пробелом,
+    чтобы "Березкин А.Н." не совпадал с "Березкина ...".
+
+    "Д-1-1" -> "д11", "Биркина Н.И." -> "биркина ни"
+    """
+    words = text.casefold().replace("ё", "е").split(maxsplit=1)
+
+    return " ".join(filter(None, (re.sub(r"[\s.\-]", "", word) for word in words)))
+
+
+def _deletes(word: str) -> Set[str]:
+    return {word[:index] + word[index + 1:] for index in range(len(word))}
+
+
+def _distance(first: str, second: str) -> int:
+    """ Расстояние Дамерау-Левенштейна без повторных правок одного места """
+    previous2 = None
+    previous = list(range(len(second) + 1))
+
+    for i in range(1, len(first) + 1):
+        current = [i] + [0] * len(second)
+
+        for j in range(1, len(second) + 1):
+            cost = first[i - 1] != second[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+
+            if (
+                    previous2 is not None and i > 1 and j > 1
+                    and first[i - 1] == second[j - 2] and first[i - 2] == second[j - 1]
+            ):
+                current[j] = min(current[j], previous2[j - 2] + 1)
+
+        previous2, previous = previous, current
+
+    return previous[-1]
+
+
+class ItemSearch:
+    """
+    Поиск групп и преподавателей по началу названия.
+
+    Ключи отсортированы, поэтому начало ищется двоичным поиском.
+    Для фамилий преподавателей заранее посчитаны начала с одной выброшенной буквой,
+    поэтому фамилия с одной опечаткой находится за несколько обращений к словарю,
+    сколько бы преподавателей ни было.
+    """
+
+    def __init__(self, item_lists: Dict[str, List[str]]):
+        self.keys: List[Tuple[str, str]] = sorted(
+            (normalize(item), item)
+            for items in item_lists.values()
+            for item in items
+        )
+        self._sorted_keys = [key for key, _ in self.keys]
+
+        #  Начало фамилии (возможно без одной буквы): (фамилия, инициалы, преподаватель)
+        self._fuzzy: Dict[str, Set[Tuple[str, str, str]]] = {}
+
+        for teacher in item_lists["teachers"]:
+            surname, _, initials = normalize(teacher).partition(" ")
+
+            for length in range(MIN_FUZZY_LENGTH, len(surname) + 1):
+                prefix = surname[:length]
+
+                for variant in {prefix} | _deletes(prefix):
+                    self._fuzzy.setdefault(variant, set()).add((surname, initials, teacher))
+
+    def search(self, query: str, limit: int) -> List[str]:
+        """
+        Сначала точное совпадение, потом преподаватели с точно такой фамилией,
+        потом совпадение по началу, потом преподаватели с одной опечаткой в фамилии.
+        """
+        normalized = normalize(query)
+        if not normalized:
+            return []
+
+        ranked: Dict[str, Tuple[int, int, str]] = {}
+
+        #  Пробел меньше букв, поэтому точно такие фамилии идут раньше более длинных
+        start = bisect.bisect_left(self._sorted_keys, normalized)
+        for key, item in self.keys[start:start + limit]:
+            if not key.startswith(normalized):
+                break
+
+            if key == normalized:
+                rank = 0
+            elif key.partition(" ")[0] == normalized:
+                rank = 1
+            else:
+                rank = 2
+
+            ranked[item] = (rank, 0, key)
+
+        word, _, rest = normalized.partition(" ")
+
+        if len(ranked) >= limit or len(word) < MIN_FUZZY_LENGTH:
+            return _by_rank(ranked, limit)
+
+        #  Сначала варианты без выброшенных букв, они ближе к запросу
+        for variant in [word, *sorted(_deletes(word))]:
+            for surname, initials, teacher in self._fuzzy.get(variant, ()):
+                if len(ranked) >= limit:
+                    break
+
+                if teacher in ranked or not initials.startswith(rest):
+                    continue
+
+                #  Опечатка могла съесть или добавить букву, поэтому сравниваем с началами разной длины
+                distance = min(
+                    _distance(word, surname[:length])
+                    for length in (len(word) - 1, len(word), len(word) + 1)
+                )
+
+                if distance <= 1:
+                    ranked[teacher] = (3, distance, normalize(teacher))
+
+        return _by_rank(ranked, limit)
+
+
+def _by_rank(ranked: Dict[str, Tuple[int, int, str]], limit: int) -> List[str]:
+    return [
+        item
+        for item, _ in sorted(ranked.items(), key=lambda pair: pair[1])
+    ][:limit]
@@ -1,6 +1,7 @@
-from typing import List
+from typing import Dict, List, Optional
 
 from . import overrides_downloader
+from .search import normalize
 
 
 def for_teacher(lesson: dict, teacher: str, group: str) -> dict | None:
@@ -24,64 +25,54 @@ def for_teacher(lesson: dict, teacher: str, group: str) -> dict | None:
                 )
     return None
 
-def combine_overrides(first, second):
-    return dict(
-        shouldBe=first["shouldBe"] or second["shouldBe"],
-        willBe=first["willBe"] or second["willBe"],
-        index=first["index"]
-    )
-        
-
-def teacher_overrides(teacher: str):
-    overrides_downloader.download_overrides("")
-    output: List[dict] = []
-    weeknum = weekday = day = month = year = 0
-
-    for group, overrides in overrides_downloader.cache.items():
-        weeknum = overrides["weekNum"]
-        weekday = overrides["weekDay"]
-        
-        day = overrides["day"]
-        month = overrides["month"]
-        year = overrides["year"]
-
-        for override in overrides["overrides"]:
-            shouldBe = for_teacher(override["shouldBe"], teacher, group)
-            willBe = for_teacher(override["willBe"], teacher, group)
-
-            if shouldBe is None and willBe is None:
-                continue
-
-            output.append(
-                dict(
-                    shouldBe=shouldBe,
-                    willBe=willBe,
-                    index=override["index"]
-                )
-            )
+class TeacherOverrides:
+    """
+    Замены по преподавателям.
+
+    Собираются один раз на каждый новый `overrides_downloader.cache`,
+    поэтому запрос замен преподавателя - это поиск в словаре.
+    """
+
+    def __init__(self, cache: Dict[str, dict]):
+        #  Преподаватель (см. `normalize`): номер пары: замена
+        self.lessons: Dict[str, Dict[int, dict]] = {}
+        self.date = dict(weekNum=0, weekDay=0, day=0, month=0, year=0)
+
+        for group, overrides in cache.items():
+            self.date = {key: overrides[key] for key in self.date}
+
+            for override in overrides["overrides"]:
+                for field in ("shouldBe", "willBe"):
+                    for teacher in lesson_teachers(override[field]):
+                        lessons = self.lessons.setdefault(normalize(teacher), {})
+                        entry = lessons.setdefault(
+                            override["index"],
+                            dict(shouldBe=None, willBe=None, index=override["index"])
+                        )
+
+                        #  Если у преподавателя несколько замен на одну пару, берётся первая
+                        entry[field] = entry[field] or for_teacher(override[field], teacher, group)
+
+    def get(self, teacher: str) -> dict:
+        return dict(
+            overrides=list(self.lessons.get(normalize(teacher), {}).values()),
+            **self.date
+        )
+
+
+def lesson_teachers(lesson: Optional[dict]) -> List[str]:
+    if lesson is None:
+        return []
+
+    if lesson.get("commonLesson"):
+        lessons = [lesson["commonLesson"]]
+    else:
+        lessons = lesson["subgroupedLesson"]["subgroups"]
+
+    return [lesson["teacher"] for lesson in lessons if lesson["teacher"]]
+
+
+async def teacher_overrides(teacher: str):
+    await overrides_downloader.download_overrides("")
 
-    lesson_indexes = [over["index"] for over in output]
-    # Индекс пары(over.index): индекс замены(overrides[INDEX])
-    inde = {}
-    
-    for index, lesson in enumerate(lesson_indexes):
-        inde[lesson] = inde.get(lesson, [])
-        inde[lesson].append(index)
-
-    for i in inde:
-        if len(inde[i]) < 2: continue
-
-        res = combine_overrides(output[inde[i][0]], output[inde[i][1]])
-        output[inde[i][0]] = res
-
-    remove = [inde[i][1] for i in inde if len(inde[i]) >= 2]
-    output = [out for index, out in enumerate(output) if index not in remove]
-    
-    return dict(
-        overrides=output,
-        weekNum=weeknum,
-        weekDay=weekday,
-        day = day,
-        month = month,
-        year = year,
-    )
+    return overrides_downloader.teachers.get(teacher)